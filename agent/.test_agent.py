@@ -3,17 +3,26 @@ Test Care Coordinator Agent in terminal/console.
 Interactive testing before building frontend.
 """
 
-import requests
-from agent import Agent
+import re
+import atexit
+import httpx
+from agent import Agent, configure_logging
 from appointment_state import Patient
 
 API_BASE = 'http://localhost:5000'
 
+# One keep-alive connection pool for all patient loads
+HTTP = httpx.Client(base_url=API_BASE, timeout=5.0, limits=httpx.Limits(max_keepalive_connections=32))
+atexit.register(HTTP.close)
+
+# Phrases in an agent reply that mean the booking went through (one pass over the reply)
+BOOKED_RE = re.compile(r'successfully|booked', re.IGNORECASE)
+
 
 def load_patient(patient_id: int) -> Patient:
     """Load patient data from API."""
     try:
-        response = requests.get(f'{API_BASE}/patient/{patient_id}')
+        response = HTTP.get(f'/patient/{patient_id}')
         
         if response.status_code != 200:
             print(f"Error loading patient: {response.text}")
@@ -93,11 +102,11 @@ def interactive_test():
                 print("✓ Conversation reset\n")
                 continue
             
-            # Get agent response
+            # Stream agent response as it is generated
             print("Agent: ", end="", flush=True)
-            response = agent.chat(user_input)
-            print(response)
-            print()
+            for chunk in agent.chat_stream(user_input):
+                print(chunk, end="", flush=True)
+            print("\n")
         
         except KeyboardInterrupt:
             print("\n\nGoodbye!")
@@ -149,13 +158,15 @@ def automated_test_scenarios():
         print(f"Agent: {response}")
         
         # Stop if booking completed
-        if "successfully" in response.lower() or "booked" in response.lower():
+        if BOOKED_RE.search(response):
             print("\n✓ Booking completed!")
             break
     
     # Show final status
+    summary = agent.turn_summary()
     print("\nFinal Booking Status:")
-    print(agent.get_booking_progress())
+    print(summary["booking_progress"])
+    print(f"Tool calls: {len(summary['tool_calls'])}, iterations left: {summary['iterations_left']}")
     
     print_separator()
     print("TESTS COMPLETE")
@@ -164,6 +175,8 @@ def automated_test_scenarios():
 
 def main():
     """Main entry point."""
+    configure_logging()
+    
     print("\nCare Coordinator Agent Testing")
     print("Choose mode:")
     print("  1. Interactive chat")
@@ -4,22 +4,340 @@ Handles conversation loop, tool calling, and OpenAI integration.
 """
 
 import os
+import re
+import sys
 import json
-from typing import List, Dict, Optional, Callable
+import time
+import queue
+import atexit
+import hashlib
+import logging
+import importlib.util
+from logging.handlers import QueueHandler, QueueListener
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, List, Dict, Optional, Callable, Iterator, Tuple
 from dotenv import load_dotenv
+import httpx
 import openai
+import orjson
 
-from config import SYSTEM_PROMPT, GREETING_PROMPT, TOOLS, TOOL_FUNCTIONS, MAX_ITERATIONS, WARNING_THRESHOLD, WARNING_MESSAGE, MODEL
+try:
+    import tiktoken
+except ImportError:  # Listed in requirements.txt; without it the cached prefix length isn't checked
+    tiktoken = None
+
+from config import (
+    CACHED_SYSTEM_BLOCK, SYSTEM_PROMPT, BOOKING_RULES, TONE_HINT, TONE_HINT_TURNS, GREETING_PROMPT, TEMPLATE_GREETING, TOOLS, TOOLS_SHA, get_tools_payload, get_tool_functions, MAX_ITERATIONS, WARNING_THRESHOLD, WARNING_MESSAGE, MODEL,
+    TEMPERATURE, DEFAULT_TEMPERATURE_MODEL_PREFIXES, PROMPT_TOOL_MODEL_PREFIXES, TOOL_CALL_PROMPT, CONFIRMATION_REPLIES, BOOKED_RESPONSE_TEMPLATE,
+    PROMPT_CACHE_MIN_TOKENS, PROMPT_CACHE_PADDING, PROMPT_CACHE_KEY, MEMORY_WINDOW_SIZE, SUMMARY_MODEL, SUMMARY_PROMPT,
+    SEMANTIC_CACHE_ENABLED, SEMANTIC_CACHE_PATH, SEMANTIC_CACHE_THRESHOLD, EMBEDDING_MODEL, TOOL_POLICIES, TOOL_SIGNATURES,
+    LOG_LEVEL, OPENAI_MAX_RETRIES, OPENAI_TIMEOUT_S, OPENAI_CONNECT_TIMEOUT_S, ENABLE_PARALLEL_TOOL_EXECUTION, MAX_TOKENS, MAX_TOKENS_AFTER_TOOLS
+)
 from appointment_state import Patient, AppointmentBooking
+from semantic_cache import SemanticCache
+from loaders import RequestLoaders, use_loaders
+
+# Tool schemas are part of the cached prompt prefix and must never change after import
+assert isinstance(TOOLS, tuple), "config.TOOLS must be a tuple"
 
 load_dotenv()
 
+logger = logging.getLogger("agent")
+
+
+def configure_logging(level: str = LOG_LEVEL) -> QueueListener:
+    """
+    Send the agent's logs to stderr from a background thread, so a request never
+    blocks on writing a log line. Call once from the entry point.
+    """
+    log_queue = queue.SimpleQueue()
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    
+    listener = QueueListener(log_queue, handler)
+    listener.start()
+    atexit.register(listener.stop)
+    
+    logger.addHandler(QueueHandler(log_queue))
+    logger.setLevel(level)
+    logger.propagate = False
+    return listener
+
+
 # Initialize OpenAI
 openai.api_key = os.getenv('OPENAI_API_KEY')
 
 if not openai.api_key:
     print("WARNING: OPENAI_API_KEY not found in .env file")
 
+# Streamed after text the model wrote before calling tools, so it doesn't run into the final reply
+STREAM_SEPARATOR = "\n\n"
+
+MAX_ITERATIONS_RESPONSE = "I've reached the maximum number of actions for this conversation. Let me summarize what we've done so far and we can continue with a fresh start if needed."
+
+# Shared OpenAI client, created on first use. It keeps a large pool of keep-alive
+# connections so concurrent conversations don't wait on (or redo) TCP/TLS setup,
+# and multiplexes requests over HTTP/2 when the optional h2 package is installed.
+_HTTP_LIMITS = httpx.Limits(max_connections=200, max_keepalive_connections=100)
+_HTTP_TIMEOUT = httpx.Timeout(OPENAI_TIMEOUT_S, connect=OPENAI_CONNECT_TIMEOUT_S)
+_HTTP2 = importlib.util.find_spec("h2") is not None
+
+_client = None
+
+
+def _get_client() -> openai.OpenAI:
+    """Get the shared OpenAI client (created on first use)."""
+    global _client
+    if _client is None:
+        _client = openai.OpenAI(
+            api_key=openai.api_key,
+            max_retries=OPENAI_MAX_RETRIES,
+            http_client=httpx.Client(limits=_HTTP_LIMITS, timeout=_HTTP_TIMEOUT, http2=_HTTP2)
+        )
+    return _client
+
+
+# Changes whenever the system block or tool schemas change (part of the semantic cache key)
+_PROMPT_VERSION = hashlib.sha1(SYSTEM_PROMPT.encode()).hexdigest() + TOOLS_SHA
+
+# Runs tool calls in parallel, and in the background while a streamed response is still arriving
+_TOOL_EXECUTOR = ThreadPoolExecutor(max_workers=8)
+
+# Shared across agents so near-duplicate questions are answered from cache
+RESPONSE_CACHE = SemanticCache(SEMANTIC_CACHE_PATH, threshold=SEMANTIC_CACHE_THRESHOLD) if SEMANTIC_CACHE_ENABLED else None
+
+
+@lru_cache(maxsize=None)
+def _get_encoding(model: str):
+    """Get tiktoken encoding for model (falls back to cl100k_base)."""
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def _pad_cached_prefix(system_content: str, model: str) -> str:
+    """
+    Make sure the static prefix (system message + tool schemas) is long enough
+    for OpenAI's automatic prompt caching, padding with a fixed block if not.
+    """
+    if tiktoken is None:
+        logger.warning("tiktoken is not installed; skipping the cached prefix length check for %s", model)
+        return system_content
+    
+    encoding = _get_encoding(model)
+    prefix_tokens = len(encoding.encode(system_content)) + len(encoding.encode(get_tools_payload().decode()))
+    
+    if prefix_tokens < PROMPT_CACHE_MIN_TOKENS:
+        logger.info("Cached prefix is %d tokens, padding to reach %d", prefix_tokens, PROMPT_CACHE_MIN_TOKENS)
+        return system_content + "\n\n" + PROMPT_CACHE_PADDING
+    
+    return system_content
+
+
+def _patient_key(patient: Patient) -> tuple:
+    """Hashable snapshot of the patient fields used in the system prompt."""
+    referrals = tuple(
+        (ref.get('specialty', 'Unknown'), ref.get('provider', 'No specific provider'))
+        for ref in patient.referrals
+    )
+    return (patient.id, patient.name, patient.dob, patient.pcp, patient.ehr_id, patient.notes, referrals)
+
+
+_PATIENT_HEADER_TMPL = """
+CURRENT PATIENT INFORMATION:
+- Name: {name}
+- DOB: {dob}
+- PCP: {pcp}
+- EHR ID: {ehr_id}
+"""
+
+
+@lru_cache(maxsize=1024)
+def _patient_context(patient_key: tuple) -> str:
+    """
+    Build stable patient context for the system prompt.
+    Only fields that don't change during a session go here, in a fixed order,
+    so the system message is identical on every call.
+    """
+    _, name, dob, pcp, ehr_id, notes, referrals = patient_key
+    
+    parts = [_PATIENT_HEADER_TMPL.format_map({"name": name, "dob": dob, "pcp": pcp, "ehr_id": ehr_id})]
+    
+    if notes:
+        parts.append(f"- Notes: {notes}\n")
+    
+    if referrals:
+        parts.append("\nREFERRALS:\n")
+        parts.extend(f"- {specialty}: {provider}\n" for specialty, provider in referrals)
+    
+    return "".join(parts)
+
+
+def _uses_native_tools(model: str) -> bool:
+    """Whether the model takes tools through the API (otherwise via TOOL_CALL_PROMPT)."""
+    return not model.startswith(PROMPT_TOOL_MODEL_PREFIXES)
+
+
+@lru_cache(maxsize=None)
+def _system_message(model: str) -> str:
+    """Build the shared system message (cached block, padded for prompt caching if needed)."""
+    if _uses_native_tools(model):
+        return _pad_cached_prefix(CACHED_SYSTEM_BLOCK, model)
+    return _pad_cached_prefix(CACHED_SYSTEM_BLOCK + "\n\n" + TOOL_CALL_PROMPT, model)
+
+
+def _message_field(message, name: str):
+    """Read a field from a history message (dicts and OpenAI message objects are mixed)."""
+    if isinstance(message, dict):
+        return message.get(name)
+    return getattr(message, name, None)
+
+
+def _message_text(message) -> str:
+    """Render a history message as a single line of text for summarization."""
+    role = _message_field(message, "role")
+    content = _message_field(message, "content") or ""
+    
+    tool_calls = _message_field(message, "tool_calls")
+    if tool_calls:
+        functions = [_message_field(tc, "function") for tc in tool_calls]
+        calls = ", ".join(f"{_message_field(fn, 'name')}({_message_field(fn, 'arguments')})" for fn in functions)
+        content = f"{content} [called: {calls}]".strip()
+    
+    if role == "tool":
+        return f"tool {_message_field(message, 'name')}: {content}"
+    return f"{role}: {content}"
+
+
+def _has_side_effects(tool_name: str) -> bool:
+    """Whether a tool writes data (unknown tools are treated as writes)."""
+    return TOOL_POLICIES.get(tool_name, {"side_effects": True})["side_effects"]
+
+
+def _cache_ttl(tool_name: str) -> float:
+    """Seconds a tool's result can be reused for the same arguments (0 for unknown tools)."""
+    return TOOL_POLICIES.get(tool_name, {}).get("cache_ttl", 0)
+
+
+def _argument_error(tool_name: str, arguments: Dict) -> Optional[str]:
+    """Check arguments against the tool's schema; returns an error message, or None if they fit."""
+    signature = TOOL_SIGNATURES.get(tool_name)
+    if signature is None:
+        return None  # Unknown tools are reported by _execute_tool
+    
+    missing = signature["required"].difference(arguments)
+    if missing:
+        return f"Missing required arguments for {tool_name}: {', '.join(sorted(missing))}"
+    
+    types = signature["types"]
+    for name, value in arguments.items():
+        if name not in types:
+            return f"Unknown argument for {tool_name}: {name}"
+        # bool is an int subclass, but true/false is never a valid ID
+        if value is not None and (not isinstance(value, types[name]) or (isinstance(value, bool) and types[name] is not bool)):
+            return f"Invalid type for {tool_name} argument {name}: {type(value).__name__}"
+    
+    return None
+
+
+# The confirmation BOOKING_RULES asks for before booking, e.g. "Ready to book: Dr. Smith (provider ID 3)
+# at Main Campus (department ID 2) on 2025-02-03 at 14:00, NEW patient appointment. Should I proceed?"
+# Everything booked on the nurse's yes comes from this text, so it's exactly what they confirmed.
+_READY_TO_BOOK_RE = re.compile(
+    r"Ready to book:.*?\(provider ID (\d+)\).*?\(department ID (\d+)\)"
+    r".*?(\d{4}-\d{2}-\d{2}) at (\d{1,2}:\d{2})\b.*?\b(NEW|ESTABLISHED)\b.*?Should I proceed\?",
+    re.DOTALL | re.IGNORECASE
+)
+
+
+class _DefaultingDetails(dict):
+    """Booking details for BOOKED_RESPONSE_TEMPLATE; a field the API left out renders as "?"."""
+    
+    def __missing__(self, key):
+        return "?"
+
+_TOOL_CALL_RE = re.compile(r"<tool_call>\s*(\{.*?\})\s*</tool_call>", re.DOTALL)
+
+
+def _extract_prompt_tool_calls(content: str, call_prefix: str) -> tuple:
+    """
+    Pull <tool_call> envelopes out of a reply from a model without native tool calling.
+    Returns (text without envelopes, tool calls in the same shape as native ones).
+    """
+    tool_calls = []
+    for i, match in enumerate(_TOOL_CALL_RE.finditer(content)):
+        try:
+            envelope = orjson.loads(match.group(1))
+        except orjson.JSONDecodeError:
+            envelope = None
+        if not isinstance(envelope, dict):
+            envelope = {"name": "invalid_tool_call", "arguments": match.group(1)}
+        
+        arguments = envelope.get("arguments", {})
+        tool_calls.append({
+            "id": f"{call_prefix}_{i}",
+            "name": sys.intern(str(envelope.get("name", ""))),
+            "arguments": arguments if isinstance(arguments, str) else orjson.dumps(arguments).decode()
+        })
+    
+    return _TOOL_CALL_RE.sub("", content).strip(), tool_calls
+
+
+def _turn_call_key(tool_name: str, arguments: Dict) -> Optional[Tuple[str, bytes]]:
+    """Key for reusing a call within a turn; None for tools with side effects, which always run."""
+    if _has_side_effects(tool_name):
+        return None
+    return tool_name, orjson.dumps(arguments, option=orjson.OPT_SORT_KEYS)
+
+
+def _parse_tool_arguments(arguments: str) -> Optional[Dict]:
+    """Parse a tool call's JSON arguments. Returns None if they aren't a JSON object."""
+    try:
+        parsed = orjson.loads(arguments or "{}")
+    except orjson.JSONDecodeError:
+        return None
+    return parsed if isinstance(parsed, dict) else None
+
+
+def _orjson_default(obj):
+    """Serialize types orjson doesn't handle natively (tools may return sets)."""
+    if isinstance(obj, (set, frozenset)):
+        return sorted(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def _dump_tool_result(result) -> str:
+    """Serialize a tool result compactly for the conversation (keys with no value are dropped)."""
+    if isinstance(result, dict):
+        result = {key: value for key, value in result.items() if value is not None}
+    return orjson.dumps(result, default=_orjson_default).decode()
+
+
+def _digest_tool_result(tool_name: str, result, content: str) -> str:
+    """One-line stand-in for a tool result once its turn is over."""
+    if len(content) <= 200:
+        return content  # Already short (ack or small result)
+    if isinstance(result, dict) and "error" in result:
+        return f"{tool_name}: error: {result['error']}"
+    return f"{tool_name}: ok (full result omitted; call again if details are needed)"
+
+
+def _log_usage(response):
+    """Log token usage, including prompt-cache hits."""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = getattr(details, "cached_tokens", 0) if details else 0
+    logger.info(
+        "OpenAI usage: prompt_tokens=%s cached_tokens=%s completion_tokens=%s",
+        usage.prompt_tokens, cached_tokens, usage.completion_tokens
+    )
+
 
 class Agent:
     """
@@ -30,23 +348,62 @@ class Agent:
         self.patient = patient
         self.booking = AppointmentBooking(patient=patient)
         self.model = model
+        self.native_tools = _uses_native_tools(model)
         self.messages = []
-        self.tool_map = TOOL_FUNCTIONS
         self.iteration_count = 0
-        self.tool_calls_log = []  # Track tool calls for debugging
+        self.turn_count = 0  # Nurse messages so far (decides whether TONE_HINT is sent)
+        self.pending_booking: Optional[Dict] = None  # book_appointment args awaiting the nurse's yes
+        self._last_call_had_tool_calls = False
+        self.tool_calls_log = deque(maxlen=10)  # Last 10 tool calls, for debugging
+        self._tool_results: Dict[str, Any] = {}  # {tool_call_id: raw result}, never sent to OpenAI
+        self._tool_cache: Dict[Tuple[str, bytes], Tuple[float, Dict]] = {}  # {(tool, args): (time, result)}
+        self._turn_calls: Dict[Tuple[str, bytes], Future] = {}  # Read-only calls made this turn, {(tool, args): Future}
+        self._loaders = RequestLoaders()  # Batched by-ID lookups shared by this turn's tool calls
+        self.summary = ""  # Running summary of turns that fell out of the window
+        self.window_size = MEMORY_WINDOW_SIZE
+        self.response_cache = RESPONSE_CACHE
         
-        # Initialize conversation with system prompt and patient context
-        patient_context = self._build_patient_context()
+        # Initialize conversation with system prompt and patient context.
+        # messages[0] is identical for every patient so all sessions share one
+        # OpenAI prompt cache entry; patient-specific context follows it.
+        self.messages.append({
+            "role": "system",
+            "content": _system_message(self.model)
+        })
         self.messages.append({
             "role": "system",
-            "content": SYSTEM_PROMPT + "\n\n" + patient_context
+            "content": self._build_patient_context()
         })
+        
+        appointment_context = self._build_appointment_context()
+        if appointment_context:
+            self.messages.append({
+                "role": "system",
+                "content": appointment_context
+            })
+        
+        # Number of leading system messages kept across resets
+        self._prefix_len = len(self.messages)
+    
+    @property
+    def tool_map(self) -> Dict[str, Callable]:
+        """Tool name -> function; the tools module is only imported once a tool is dispatched."""
+        return get_tool_functions()
     
     def generate_initial_greeting(self) -> str:
         """
         Generate initial greeting using LLM based on patient context.
         Agent can call tools (e.g., check insurance) during greeting.
+        Patients with accepted insurance and no referrals get TEMPLATE_GREETING without a model call.
         """
+        if (self.patient.insurance or {}).get("accepted") and not self.patient.referrals:
+            greeting = TEMPLATE_GREETING.format(name=self.patient.name)
+            self.messages.append({"role": "user", "content": GREETING_PROMPT})
+            self._add_assistant_message(greeting, [])
+            return greeting
+        
+        fallback_greeting = f"Hi! I'm here to help book an appointment for {self.patient.name}. What details can you provide?"
+        
         try:
             # Add greeting prompt
             self.messages.append({
@@ -54,155 +411,685 @@ class Agent:
                 "content": GREETING_PROMPT
             })
             
-            # Allow tool calls during greeting
-            while True:
-                response = openai.chat.completions.create(
-                    model=self.model,
-                    messages=self.messages,
-                    tools=TOOLS,
-                    temperature=0.7,
-                    max_tokens=300
+            # Allow tool calls during greeting (bounded like chat)
+            for _ in range(MAX_ITERATIONS):
+                response = _get_client().chat.completions.create(
+                    messages=self._request_messages(),
+                    max_tokens=300,
+                    **self._completion_options()
                 )
+                _log_usage(response)
                 
                 assistant_message = response.choices[0].message
-                self.messages.append(assistant_message)
                 
-                # If tool calls, execute them
-                if assistant_message.tool_calls:
-                    for tool_call in assistant_message.tool_calls:
-                        tool_name = tool_call.function.name
-                        tool_args = json.loads(tool_call.function.arguments)
-                        
-                        result = self._execute_tool(tool_name, tool_args)
-                        
-                        self.messages.append({
-                            "role": "tool",
-                            "tool_call_id": tool_call.id,
-                            "name": tool_name,
-                            "content": json.dumps(result)
-                        })
+                # If tool calls, execute them and let the model continue
+                if self._handle_tool_calls(assistant_message):
                     continue
                 
                 # No tool calls, return greeting
+                self._compact_tool_results()
                 return assistant_message.content
         
         except Exception as e:
             # Fallback if LLM fails
-            return f"Hi! I'm here to help book an appointment for {self.patient.name}. What details can you provide?"
+            return fallback_greeting
+        
+        # Model kept calling tools without producing a greeting
+        return fallback_greeting
     
     def _build_patient_context(self) -> str:
-        """Build patient context string for system prompt."""
-        context = f"""
-		CURRENT PATIENT INFORMATION:
-		- Name: {self.patient.name}
-		- DOB: {self.patient.dob}
-		- PCP: {self.patient.pcp}
-		- EHR ID: {self.patient.ehr_id}
-		"""
-        
-        if self.patient.notes:
-            context += f"- Notes: {self.patient.notes}\n"
-        
-        if self.patient.referrals:
-            context += "\nREFERRALS:\n"
-            for ref in self.patient.referrals:
-                specialty = ref.get('specialty', 'Unknown')
-                provider = ref.get('provider', 'No specific provider')
-                context += f"- {specialty}: {provider}\n"
-        
-        if self.patient.appointments:
-            context += f"\nRECENT APPOINTMENT HISTORY ({len(self.patient.appointments)} appointments):\n"
-            for apt in self.patient.appointments[:5]:  # Show last 5
-                context += f"- {apt.get('date')}: {apt.get('provider')} ({apt.get('status')})\n"
-        
-        return context
+        """Build stable patient context for the system prompt."""
+        return _patient_context(_patient_key(self.patient))
+    
+    def _build_appointment_context(self) -> str:
+        """Build appointment history context (sent after the cached prefix)."""
+        if not self.patient.appointments:
+            return ""
+        
+        parts = [f"RECENT APPOINTMENT HISTORY ({len(self.patient.appointments)} appointments):\n"]
+        parts.extend(
+            f"- {apt.get('date')}: {apt.get('provider')} ({apt.get('status')})\n"
+            for apt in self.patient.appointments[:5]  # Show last 5
+        )
+        
+        return "".join(parts)
     
     def chat(self, user_message: str) -> str:
         """
         Process user message and return agent's response.
         Handles tool calling loop internally.
+        Only the final reply is returned; text the model wrote before calling tools is dropped.
         """
-        self.messages.append({
-            "role": "user",
-            "content": user_message
-        })
+        turn = self._chat_turn(user_message)
+        while True:
+            try:
+                next(turn)
+            except StopIteration as done:
+                return done.value
+    
+    def chat_stream(self, user_message: str) -> Iterator[str]:
+        """
+        Process user message and yield agent's response as it is generated.
+        Handles tool calling loop internally.
+        Text the model writes before calling tools is streamed too (e.g. "Let me check."),
+        followed by STREAM_SEPARATOR so it doesn't run into the final reply.
+        """
+        yield from self._chat_turn(user_message)
+    
+    def _chat_turn(self, user_message: str):
+        """
+        Run one turn, yielding text as it streams (see chat_stream).
+        Returns the final reply: the text of the last, tool-free model call.
+        """
+        cache_key, cached_response = self._start_turn(user_message)
+        if cached_response is not None:
+            yield cached_response
+            return cached_response
+        
+        turn_had_tool_calls = False
         
         # Conversation loop with tool calling
         while self.iteration_count < MAX_ITERATIONS:
-            self.iteration_count += 1
-            
-            # Warning if approaching iteration limit
-            if self.iteration_count == WARNING_THRESHOLD:
-                self.messages.append({
-                    "role": "system",
-                    "content": WARNING_MESSAGE
-                })
+            self._start_iteration()
             
             # Call OpenAI with tools
             try:
-                response = openai.chat.completions.create(
-                    model=self.model,
-                    messages=self.messages,
-                    tools=TOOLS,
-                    temperature=0.7,
-                    max_tokens=1000
-                )
-                
-                assistant_message = response.choices[0].message
+                content, text, tool_calls, pending = yield from self._stream_completion()
+                self._add_assistant_message(content, tool_calls)
                 
-                # Add assistant message to history
-                self.messages.append(assistant_message)
-
                 # Check for tool calls (OpenAI native format)
-                if assistant_message.tool_calls:
-                    # Execute tools and add results
-                    for tool_call in assistant_message.tool_calls:
-                        tool_name = tool_call.function.name
-                        tool_args = json.loads(tool_call.function.arguments)
-                        
-                        # Log tool call for debugging
-                        self.tool_calls_log.append({
-                            "tool": tool_name,
-                            "args": tool_args,
-                            "iteration": self.iteration_count
-                        })
-                        
-                        # Execute tool
-                        result = self._execute_tool(tool_name, tool_args)
-                        
-                        # Add tool result to conversation
-                        self.messages.append({
-                            "role": "tool",
-                            "tool_call_id": tool_call.id,
-                            "name": tool_name,
-                            "content": json.dumps(result)
-                        })
+                if tool_calls:
+                    turn_had_tool_calls = True
+                    if text:
+                        yield STREAM_SEPARATOR  # What streamed so far was a preamble, not the reply
+                    self._add_tool_results(tool_calls, pending)
                     
                     # Continue loop to get agent's response to tool results
                     continue
                 
-                # No tool calls, return response to user
-                return assistant_message.content
+                # No tool calls, finish response to user
+                self._finish_turn(cache_key, turn_had_tool_calls, content)
+                return text
                 
             except Exception as e:
                 error_message = f"Error calling OpenAI: {str(e)}"
-                print(error_message)
+                logger.warning(error_message)
+                yield error_message
                 return error_message
         
         # Hit max iterations
-        return "I've reached the maximum number of actions for this conversation. Let me summarize what we've done so far and we can continue with a fresh start if needed."
+        yield MAX_ITERATIONS_RESPONSE
+        return MAX_ITERATIONS_RESPONSE
+    
+    def _start_turn(self, user_message: str) -> tuple:
+        """
+        Add the nurse's message to the conversation.
+        Returns (cache_key, cached_response); cached_response is set on a semantic cache hit
+        or when a booking the nurse just confirmed was made directly.
+        """
+        self._turn_calls.clear()
+        self._loaders = RequestLoaders()
+        self._last_call_had_tool_calls = False
+        self.turn_count += 1
+        pending_booking, self.pending_booking = self.pending_booking, None
+        
+        if pending_booking and " ".join(user_message.lower().strip(" .!").split()) in CONFIRMATION_REPLIES:
+            self.messages.append({
+                "role": "user",
+                "content": user_message
+            })
+            # On failure the tool result is in history and the model explains it (uncached)
+            return None, self._book_pending(pending_booking)
+        
+        cache_key = self._response_cache_key(user_message)
+        
+        self.messages.append({
+            "role": "user",
+            "content": user_message
+        })
+        
+        # Reuse the response to a near-duplicate message in the same booking state
+        if cache_key:
+            cached_response = self.response_cache.get(*cache_key)
+            if cached_response is not None:
+                self.messages.append({
+                    "role": "assistant",
+                    "content": cached_response
+                })
+                self.pending_booking = self._pending_booking_from(cached_response)
+                self._compact_history()
+                return cache_key, cached_response
+        
+        return cache_key, None
+    
+    def _book_pending(self, arguments: Dict) -> Optional[str]:
+        """
+        Make the booking the nurse just confirmed without a model call.
+        Returns the templated confirmation, or None if booking failed.
+        """
+        call = {
+            "id": f"call_confirmed_{self.turn_count}",
+            "name": sys.intern("book_appointment"),
+            "arguments": orjson.dumps(arguments).decode()
+        }
+        self._add_assistant_message(None, [call])
+        self._add_tool_results([call], {})
+        
+        result = self._tool_results.get(call["id"])
+        if not isinstance(result, dict) or not result.get("success"):
+            return None
+        
+        # The booking is already made, so fields missing from the API's details fall back to
+        # the confirmed arguments (or "?") rather than failing the turn
+        details = result.get("details")
+        response = BOOKED_RESPONSE_TEMPLATE.format_map(_DefaultingDetails(
+            {"date": arguments["date"], "appointment_time": arguments["appointment_time"], "type": arguments["appointment_type"]},
+            **(details if isinstance(details, dict) else {})
+        ))
+        self._add_assistant_message(response, [])
+        self._finish_turn(None, True, response)
+        return response
+    
+    def _pending_booking_from(self, content: Optional[str]) -> Optional[Dict]:
+        """
+        book_appointment arguments if the reply asks the nurse to confirm a booking.
+        None (the model handles the yes) unless the provider and department in the text
+        are the ones the booking state last looked up.
+        """
+        if not content or not self.native_tools:
+            return None
+        
+        match = _READY_TO_BOOK_RE.search(content)
+        if not match:
+            return None
+        
+        provider_id, department_id, date, appointment_time, appointment_type = match.groups()
+        if (int(provider_id), int(department_id)) != (self.booking.provider_id, self.booking.department_id):
+            return None
+        
+        return {
+            "patient_id": self.patient.id,
+            "provider_id": int(provider_id),
+            "department_id": int(department_id),
+            "appointment_type": appointment_type.upper(),
+            "date": date,
+            "appointment_time": appointment_time.zfill(5)
+        }
+    
+    def _start_iteration(self):
+        """Count a model call, warning the model if approaching the iteration limit."""
+        self.iteration_count += 1
+        
+        if self.iteration_count == WARNING_THRESHOLD:
+            self.messages.append({
+                "role": "system",
+                "content": WARNING_MESSAGE
+            })
+    
+    def _max_tokens(self) -> int:
+        """Response budget for the next call (see MAX_TOKENS in config)."""
+        if self._last_call_had_tool_calls or self.iteration_count >= MAX_ITERATIONS:
+            return MAX_TOKENS_AFTER_TOOLS
+        return MAX_TOKENS
+    
+    def _handle_tool_calls(self, assistant_message) -> bool:
+        """
+        Add a (non-streamed) assistant message to history and run any tool calls it made.
+        Returns True if there were tool calls, i.e. the model needs another iteration.
+        """
+        if self.native_tools:
+            tool_calls = [
+                {"id": tc.id, "name": sys.intern(tc.function.name), "arguments": tc.function.arguments}
+                for tc in assistant_message.tool_calls or []
+            ]
+            self._add_assistant_message(assistant_message.content, tool_calls)
+        else:
+            _, tool_calls = _extract_prompt_tool_calls(assistant_message.content or "", f"call_{self.iteration_count}")
+            self._add_assistant_message(assistant_message.content, tool_calls)
+        
+        if tool_calls:
+            self._add_tool_results(tool_calls, {})
+        return bool(tool_calls)
+    
+    def _completion_options(self) -> Dict:
+        """
+        Model settings shared by every chat completion call.
+        prompt_cache_key goes through extra_body so older SDK versions can send it too.
+        """
+        options = {"model": self.model, "extra_body": {"prompt_cache_key": PROMPT_CACHE_KEY}}
+        if self.native_tools:  # Other model families reject these settings
+            if not self.model.startswith(DEFAULT_TEMPERATURE_MODEL_PREFIXES):
+                options["temperature"] = TEMPERATURE
+            options["tools"] = TOOLS
+            options["parallel_tool_calls"] = True
+        return options
+    
+    def _add_assistant_message(self, content: Optional[str], tool_calls: List[Dict]):
+        """
+        Add assistant message (and any tool calls it made) to history.
+        Without native tools the raw reply, envelopes included, is the record of the calls.
+        """
+        self._last_call_had_tool_calls = bool(tool_calls)
+        assistant_message = {"role": "assistant", "content": content or None}
+        if tool_calls and self.native_tools:
+            assistant_message["tool_calls"] = [
+                {
+                    "id": call["id"],
+                    "type": "function",
+                    "function": {"name": call["name"], "arguments": call["arguments"]}
+                }
+                for call in tool_calls
+            ]
+        self.messages.append(assistant_message)
+    
+    def _finish_turn(self, cache_key: Optional[tuple], turn_had_tool_calls: bool, content: Optional[str]):
+        """Cache the final response if it can be reused, then trim history."""
+        # Only cache responses that didn't depend on tool calls
+        if cache_key and not turn_had_tool_calls and content:
+            self.response_cache.set(*cache_key, content)
+        
+        self.pending_booking = self._pending_booking_from(content)
+        self._compact_tool_results()
+        self._compact_history()
+    
+    def _request_messages(self) -> List:
+        """
+        Conversation to send to OpenAI: history plus the current booking state, preceded by
+        BOOKING_RULES until an appointment is booked and TONE_HINT for the first few turns.
+        """
+        sections = []
+        if not self.booking.is_complete():
+            sections.append(BOOKING_RULES)
+        if self.turn_count <= TONE_HINT_TURNS:
+            sections.append(TONE_HINT)
+        sections.append(f"CURRENT BOOKING STATE:\n{self._booking_state_summary()}")
+        
+        return self.messages + [{
+            "role": "system",
+            "content": "\n\n".join(sections)
+        }]
+    
+    def _booking_state_summary(self) -> str:
+        """Booking summary with the IDs the model needs for follow-up tool calls."""
+        lines = [self.booking.summary()]
+        if self.booking.provider_id:
+            lines.append(f"Provider ID: {self.booking.provider_id}")
+        if self.booking.department_id:
+            lines.append(f"Department ID: {self.booking.department_id}")
+        return "\n".join(lines)
+    
+    def _compact_tool_results(self):
+        """
+        Replace tool results from the finished turn with one-line digests.
+        The model already answered from them and the booking state carries what matters;
+        raw results stay in self._tool_results.
+        """
+        for message in self.messages[self._prefix_len:]:
+            if not isinstance(message, dict) or message.get("role") != "tool":
+                continue
+            result = self._tool_results.get(message["tool_call_id"])
+            if result is not None:
+                message["content"] = _digest_tool_result(message["name"], result, message["content"])
+    
+    def _stream_completion(self):
+        """
+        Stream one completion, yielding text as it arrives.
+        Tool calls are started in the background as soon as their arguments are
+        complete, while the rest of the response is still streaming.
+        Returns (content, text, tool_calls, pending): the raw reply, the text that was yielded,
+        the tool calls, and a map of tool call index to Future for calls already started.
+        """
+        stream = _get_client().chat.completions.create(
+            messages=self._request_messages(),
+            max_tokens=self._max_tokens(),
+            stream=True,
+            stream_options={"include_usage": True},
+            **self._completion_options()
+        )
+        
+        content_parts = []
+        calls = {}  # {index: {"id": str, "name": str, "arguments": str}}
+        pending = {}  # {index: Future}
+        first_write_index = None  # Nothing after a side-effecting call is started early
+        
+        for chunk in stream:
+            if chunk.usage:
+                _log_usage(chunk)
+            if not chunk.choices:
+                continue
+            
+            delta = chunk.choices[0].delta
+            
+            if delta.content:
+                content_parts.append(delta.content)
+                if self.native_tools:
+                    yield delta.content
+            
+            for tool_delta in delta.tool_calls or []:
+                call = calls.setdefault(tool_delta.index, {"id": None, "name": "", "arguments": ""})
+                if tool_delta.id:
+                    call["id"] = tool_delta.id
+                if tool_delta.function:
+                    if tool_delta.function.name:
+                        call["name"] += tool_delta.function.name
+                    if tool_delta.function.arguments:
+                        call["arguments"] += tool_delta.function.arguments
+                
+                if call["name"] and _has_side_effects(call["name"]) and first_write_index is None:
+                    first_write_index = tool_delta.index
+                
+                # Start a read-only tool once its arguments parse as a complete JSON object
+                # (get_available_times waits for the full response so per-day calls can be merged)
+                can_start_early = (
+                    ENABLE_PARALLEL_TOOL_EXECUTION
+                    and tool_delta.index not in pending
+                    and call["name"] != "get_available_times"
+                    and (first_write_index is None or tool_delta.index < first_write_index)
+                    and call["arguments"].rstrip().endswith("}")
+                )
+                if can_start_early:
+                    tool_args = _parse_tool_arguments(call["arguments"])
+                    if tool_args is not None and call["name"] in self.tool_map:
+                        pending[tool_delta.index] = self._submit_tool(call["name"], tool_args)
+        
+        content = "".join(content_parts)
+        if not self.native_tools:
+            # Envelopes can't be told apart from text mid-stream, so the text goes out at the end
+            text, tool_calls = _extract_prompt_tool_calls(content, f"call_{self.iteration_count}")
+            if text:
+                yield text
+            return content, text, tool_calls, {}
+        
+        tool_calls = [calls[index] for index in sorted(calls)]
+        for call in tool_calls:
+            call["name"] = sys.intern(call["name"])  # Matches config's interned names by identity
+        pending = {position: pending[index] for position, index in enumerate(sorted(calls)) if index in pending}
+        return content, content, tool_calls, pending
+    
+    def _add_tool_results(self, tool_calls: List[Dict], pending: Dict):
+        """
+        Execute (or collect already started) tool calls and add their results to the conversation.
+        Read-only calls run in parallel; if any call has side effects the rest run in order.
+        """
+        parsed_args = [_parse_tool_arguments(call["arguments"]) for call in tool_calls]
+        
+        if ENABLE_PARALLEL_TOOL_EXECUTION and not any(_has_side_effects(call["name"]) for call in tool_calls):
+            pending = dict(pending)
+            pending.update(self._coalesce_available_times(tool_calls, parsed_args, pending))
+            for position, call in enumerate(tool_calls):
+                if position not in pending and parsed_args[position] is not None:
+                    pending[position] = self._submit_tool(call["name"], parsed_args[position])
+        
+        # Results are added in call order so each tool_call_id lines up with its response
+        for position, call in enumerate(tool_calls):
+            tool_name = call["name"]
+            tool_args = parsed_args[position]
+            
+            # Log tool call for debugging
+            self.tool_calls_log.append({
+                "tool": tool_name,
+                "args": tool_args if tool_args is not None else call["arguments"],
+                "iteration": self.iteration_count
+            })
+            
+            # Execute tool (malformed arguments go back to the model as an error so it can retry)
+            if position in pending:
+                result = pending[position].result()
+            elif tool_args is None:
+                result = {"error": f"Invalid arguments for {tool_name}: expected a JSON object"}
+            else:
+                result = self._call_tool(tool_name, tool_args)
+            
+            # Results fully captured in booking state are sent as a short ack
+            ack = self._update_booking_state(tool_name, tool_args, result)
+            self._tool_results[call["id"]] = result
+            
+            # Add tool result to conversation
+            if self.native_tools:
+                self.messages.append({
+                    "role": "tool",
+                    "tool_call_id": call["id"],
+                    "name": tool_name,
+                    "content": ack or _dump_tool_result(result)
+                })
+            else:
+                self.messages.append({
+                    "role": "user",
+                    "content": f'<tool_result name="{tool_name}">{ack or _dump_tool_result(result)}</tool_result>'
+                })
+    
+    def _coalesce_available_times(self, tool_calls: List[Dict], parsed_args: List, pending: Dict) -> Dict:
+        """
+        Merge get_available_times calls for the same provider and location into one range query.
+        Returns {position: Future}; every merged call gets the combined result.
+        """
+        groups = {}  # {(provider_id, department_id): [position, ...]}
+        for position, call in enumerate(tool_calls):
+            args = parsed_args[position]
+            if call["name"] != "get_available_times" or position in pending or args is None:
+                continue
+            if not isinstance(args.get("start_date"), str) or not isinstance(args.get("end_date") or "", str):
+                continue
+            groups.setdefault((args.get("provider_id"), args.get("department_id")), []).append(position)
+        
+        merged = {}
+        for (provider_id, department_id), positions in groups.items():
+            if len(positions) < 2:
+                continue
+            
+            # Dates are YYYY-MM-DD, so string order is date order
+            start_dates = [parsed_args[position]["start_date"] for position in positions]
+            end_dates = [parsed_args[position].get("end_date") or parsed_args[position]["start_date"] for position in positions]
+            range_args = {
+                "provider_id": provider_id,
+                "department_id": department_id,
+                "start_date": min(start_dates),
+                "end_date": max(end_dates)
+            }
+            
+            future = _TOOL_EXECUTOR.submit(self._execute_tool, "get_available_times", range_args)
+            for position in positions:
+                merged[position] = future
+        
+        return merged
+    
+    def _response_cache_key(self, user_message: str) -> Optional[tuple]:
+        """
+        Build (embedding, state_hash) for the semantic response cache.
+        Returns None if caching is disabled or the embedding call fails.
+        """
+        if self.response_cache is None:
+            return None
+        
+        normalized = " ".join(user_message.lower().split())
+        
+        try:
+            response = _get_client().embeddings.create(model=EMBEDDING_MODEL, input=normalized)
+            embedding = response.data[0].embedding
+        except Exception as e:
+            logger.warning("Error embedding message for cache: %s", e)
+            return None
+        
+        return embedding, self._booking_state_hash()
+    
+    def _booking_state_hash(self) -> str:
+        """
+        Hash of the state a response depends on. Includes the last assistant reply,
+        so short answers like "yes" are only reused at the same point in a conversation,
+        and the prompt/tool versions, so persisted answers expire when either changes.
+        """
+        last_reply = ""
+        for message in reversed(self.messages):
+            if _message_field(message, "role") == "assistant" and _message_field(message, "content"):
+                last_reply = _message_field(message, "content")
+                break
+        
+        state = [
+            _PROMPT_VERSION,
+            self.patient.id,
+            self.booking.provider_id,
+            self.booking.department_id,
+            self.booking.appointment_type,
+            self.booking.date,
+            last_reply
+        ]
+        return hashlib.sha1(json.dumps(state).encode()).hexdigest()
+    
+    def _submit_tool(self, tool_name: str, arguments: Dict) -> Future:
+        """Start a tool call in the background, reusing an identical read-only call from this turn."""
+        key = _turn_call_key(tool_name, arguments)
+        future = self._turn_calls.get(key) if key else None
+        if future is None:
+            future = _TOOL_EXECUTOR.submit(self._execute_tool, tool_name, arguments)
+            if key:
+                self._turn_calls[key] = future
+        return future
+    
+    def _call_tool(self, tool_name: str, arguments: Dict) -> Dict:
+        """Run a tool in this thread, reusing an identical read-only call from this turn."""
+        key = _turn_call_key(tool_name, arguments)
+        if key in self._turn_calls:
+            return self._turn_calls[key].result()
+        
+        result = self._execute_tool(tool_name, arguments)
+        if key:
+            self._turn_calls[key] = future = Future()
+            future.set_result(result)
+        return result
     
     def _execute_tool(self, tool_name: str, arguments: Dict) -> Dict:
-        """Execute a tool and return its result."""
-        if tool_name not in self.tool_map:
+        """
+        Execute a tool and return its result.
+        Cacheable read tools reuse a result from the last cache_ttl seconds (see TOOL_POLICIES);
+        any tool with side effects clears the cache, since it may change what reads return.
+        """
+        tool_function = self.tool_map.get(tool_name)
+        if tool_function is None:
             return {"error": f"Unknown tool: {tool_name}"}
         
+        argument_error = _argument_error(tool_name, arguments)
+        if argument_error:
+            return {"error": argument_error}
+        
+        ttl = _cache_ttl(tool_name)
+        if ttl:
+            key = (tool_name, orjson.dumps(arguments, option=orjson.OPT_SORT_KEYS))
+            cached = self._tool_cache.get(key)
+            if cached and time.monotonic() - cached[0] < ttl:
+                return cached[1]
+        elif _has_side_effects(tool_name):
+            self._tool_cache.clear()
+            self._turn_calls.clear()
+            self._loaders = RequestLoaders()
+        
         try:
-            tool_function = self.tool_map[tool_name]
-            result = tool_function(**arguments)
-            return result
+            with use_loaders(self._loaders):
+                result = tool_function(**arguments)
         except Exception as e:
             return {"error": f"Tool execution failed: {str(e)}"}
+        
+        if ttl and not (isinstance(result, dict) and "error" in result):
+            self._tool_cache[key] = (time.monotonic(), result)
+        return result
+    
+    def _update_booking_state(self, tool_name: str, arguments: Dict, result: Dict) -> Optional[str]:
+        """
+        Record booking-relevant fields from a tool call.
+        Returns a short ack if the result is fully captured by booking state, else None.
+        """
+        if not isinstance(arguments, dict) or not isinstance(result, dict) or "error" in result:
+            return None
+        
+        if tool_name == "check_appointment_history":
+            self.booking.provider_id = arguments.get("provider_id")
+            self.booking.appointment_type = result.get("appointment_type")
+            return f"ok: appointment_type set to {self.booking.appointment_type} ({result.get('reason')})"
+        
+        if tool_name == "get_available_times":
+            self.booking.provider_id = arguments.get("provider_id")
+            self.booking.department_id = arguments.get("department_id")
+        
+        elif tool_name == "book_appointment" and result.get("success"):
+            self.booking.provider_id = arguments.get("provider_id")
+            self.booking.department_id = arguments.get("department_id")
+            self.booking.appointment_type = arguments.get("appointment_type")
+            self.booking.date = arguments.get("date")
+            self.booking.appointment_time = arguments.get("appointment_time")
+            self.booking.notes = arguments.get("notes")
+            
+            details = result.get("details", {})
+            self.booking.provider_name = details.get("provider")
+            self.booking.location_name = details.get("location")
+        
+        return None
+    
+    def _compact_history(self):
+        """
+        Keep the last `window_size` messages after the system prefix and fold older
+        turns into a running summary, so the prompt stops growing with the conversation.
+        """
+        start = self._prefix_len + (1 if self.summary else 0)
+        history = self.messages[start:]
+        
+        if len(history) <= self.window_size:
+            return
+        
+        # Only cut at a user message so tool results stay with their tool call
+        cut = None
+        for i in range(len(history) - self.window_size, len(history)):
+            if _message_field(history[i], "role") == "user":
+                cut = i
+                break
+        
+        if not cut:
+            return
+        
+        summary = self._summarize(history[:cut])
+        if summary is None:
+            return  # Keep full history if summarization fails
+        
+        self.summary = summary
+        self.messages[self._prefix_len:start + cut] = [{
+            "role": "system",
+            "content": f"Prior conversation summary: {self.summary}"
+        }]
+        self._prune_tool_state()
+    
+    def _prune_tool_state(self):
+        """Drop raw results for tool messages no longer in history, and expired cache entries."""
+        live_ids = {
+            _message_field(message, "tool_call_id")
+            for message in self.messages
+            if _message_field(message, "role") == "tool"
+        }
+        for call_id in [call_id for call_id in self._tool_results if call_id not in live_ids]:
+            del self._tool_results[call_id]
+        
+        now = time.monotonic()
+        for key in [key for key, (stored_at, _) in self._tool_cache.items() if now - stored_at >= _cache_ttl(key[0])]:
+            del self._tool_cache[key]
+    
+    def _summarize(self, messages: List) -> Optional[str]:
+        """Summarize old turns (plus the existing summary) with a cheap model."""
+        transcript = "\n".join(_message_text(message) for message in messages)
+        if self.summary:
+            transcript = f"Existing summary: {self.summary}\n\n{transcript}"
+        
+        try:
+            response = _get_client().chat.completions.create(
+                model=SUMMARY_MODEL,
+                messages=[
+                    {"role": "system", "content": SUMMARY_PROMPT},
+                    {"role": "user", "content": transcript}
+                ],
+                temperature=0,
+                max_tokens=200
+            )
+            _log_usage(response)
+            return response.choices[0].message.content
+        except Exception as e:
+            logger.warning("Error summarizing conversation: %s", e)
+            return None
     
     def get_booking_progress(self) -> str:
         """Get current booking progress summary."""
@@ -210,11 +1097,29 @@ class Agent:
     
     def get_tool_calls(self) -> list:
         """Get recent tool calls for debugging."""
-        return self.tool_calls_log[-10:]  # Last 10 calls
+        return list(self.tool_calls_log)
     
+    def turn_summary(self) -> Dict:
+        """
+        Everything a UI shows after a turn, in one dict (keys match the frontend's
+        message payload), instead of a separate getter call per field.
+        """
+        return {
+            "booking_progress": self.booking.summary(),
+            "tool_calls": list(self.tool_calls_log),
+            "iterations_left": MAX_ITERATIONS - self.iteration_count
+        }
+
     def reset_conversation(self):
         """Reset conversation but keep patient context."""
-        self.messages = [self.messages[0]]  # Keep system prompt
+        del self.messages[self._prefix_len:]  # Keep system prompt + patient context
         self.iteration_count = 0
+        self.turn_count = 0
+        self.pending_booking = None
         self.booking = AppointmentBooking(patient=self.patient)
-        self.tool_calls_log = []  # Clear tool calls log
\ No newline at end of file
+        self.tool_calls_log.clear()
+        self._tool_results.clear()
+        self._tool_cache.clear()
+        self._turn_calls.clear()
+        self._loaders = RequestLoaders()
+        self.summary = ""
\ No newline at end of file
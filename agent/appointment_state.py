@@ -3,14 +3,18 @@ State management for Care Coordinator Agent.
 Tracks patient information and appointment booking progress.
 """
 
+import sys
 from dataclasses import dataclass, field
 from typing import Optional, List, Dict
 from datetime import datetime
 
+# __slots__ drop the per-instance __dict__ (dataclass slots need Python 3.10+)
+_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
 
-@dataclass
+
+@dataclass(frozen=True, **_SLOTS)
 class Patient:
-    """Patient information loaded from API."""
+    """Patient information loaded from API (read-only for the life of a session)."""
     id: int
     name: str
     dob: str
@@ -37,7 +41,7 @@ class Patient:
         )
 
 
-@dataclass
+@dataclass(**_SLOTS)
 class AppointmentBooking:
     """
     Tracks appointment booking progress.
@@ -55,15 +59,14 @@ class AppointmentBooking:
     
     def is_complete(self) -> bool:
         """Check if all required fields are collected."""
-        required = [
-            self.patient,
-            self.provider_id,
-            self.department_id,
-            self.appointment_type,
-            self.date,
-            self.appointment_time
-        ]
-        return all(field is not None for field in required)
+        return (
+            self.patient is not None
+            and self.provider_id is not None
+            and self.department_id is not None
+            and self.appointment_type is not None
+            and self.date is not None
+            and self.appointment_time is not None
+        )
     
     def missing_fields(self) -> List[str]:
         """Return list of missing required fields."""
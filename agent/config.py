@@ -3,17 +3,13 @@ Configuration for Care Coordinator Agent.
 Includes system prompt and tool definitions.
 """
 
-from tools import (
-    get_providers_by_specialty,
-    get_provider_locations,
-    get_available_times,
-    check_appointment_history,
-    check_insurance,
-    get_self_pay_rate,
-    set_patient_insurance,
-    book_appointment,
-    query_database
-)
+import os
+import sys
+import json
+import hashlib
+import importlib
+from functools import lru_cache
+from typing import Callable, Dict
 
 # Greeting prompt for initial message generation
 GREETING_PROMPT = """Generate your initial greeting to the nurse for this patient. 
@@ -30,279 +26,423 @@ Example format:
 
 Now generate the greeting for the current patient based on their information."""
 
-# System prompt for Care Coordinator Agent
-SYSTEM_PROMPT = """You are a Care Coordinator Assistant helping hospital nurses book patient appointments.
-
-WHO YOU'RE HELPING:
-The nurse is working with a specific patient. The patient's information (name, DOB, PCP, referrals, appointment history, insurance, notes) is provided to you at the start of each conversation and you can see it in the context. The nurse may have additional information the patient told them directly, or they may be figuring things out as they go, and may or may not be talking with the patient at this moment. Your job is to help them successfully book an appointment.
-You dont just want to book a random appointment, but the best available appointment given the patient's needs and the nurse's input.
-While we want to book the appointment efficiently and quickly, we also want to be thorough and helpful to the nurse, without cutting corners or making assumptions.
-
-
-WHAT YOU CAN DO AT ANY MOMENT:
-- Respond to the nurse with information, questions, or confirmation
-- Call tools to query the database (get provider info, check availability, verify insurance, etc.)
-- Book an appointment using the book_appointment tool (only after confirming all details with the nurse)
-
-THE DATABASE:
-Our hospital database contains providers, departments/locations, appointment schedules, patients, insurances, and referrals. You have access to pre-built query tools for common operations, plus a general query_database tool for custom SQL SELECT queries when you need something specific. You can see all available tools and their parameters.
-
-INSURANCE:
-If the patient has insurance, check if it's accepted. If not accepted or missing, the patient will need to self-pay. You can look up self-pay rates by specialty using the get_self_pay_rate tool. If the nurse provides new insurance info, use set_patient_insurance to update it (it'll tell you if we accept it or not).
-
-BOOKING AN APPOINTMENT REQUIRES:
-- Patient ID (you already have this)
-- Provider ID (which doctor - look up by specialty if needed)
-- Department ID (which location - providers can work at multiple locations)
-- Appointment type: NEW (patient hasn't seen this provider in 5+ years) or ESTABLISHED (patient has seen them recently) - use check_appointment_history to determine this
-- Date and time (check availability with get_available_times)
-- Optional: notes
-
-BEFORE YOU BOOK:
-You must confirm the final details with the nurse. Don't just book silently. Say something like "Ready to book: Dr. Smith at Main Campus on Monday Feb 3 at 2:00pm, NEW patient appointment. Should I proceed?" Wait for confirmation, then call book_appointment.
-
-YOUR APPROACH:
-When the nurse asks for something, figure out what information you need. If you need to look things up, call the appropriate tools and present the findings. If there are multiple options (several providers, many time slots, multiple locations), present them clearly and let the nurse choose - don't pick for them. If something is ambiguous or you're missing key information, ask. 
-It's up to you to determine if the next best action is to get more information yourself with tool calls, or ask the nurse for specific clarifications. 
-You know what information is needed to book the appointment, and you can drive towards that to make your next decision.
-This will likely be an iterative process between you and the nurse, though it's possible with the initial info you get from the patient info and nurse, as wel as info you can get from the dbs, that you can present an ideal appointment or set of potential appointments very quickly.
-
-A good time to ask for info is when:
--You need more clarity about the patient's needs or preferences for an appointment to narrow it down, such as after you have returned a broad range from the db
--You need some specific info to make a specific db call that would help you narrow down the options or confirm the appointment
--Other times you think it's valuable
-
-TOOL CALL LIMIT:
-You have a limit of 10 tool calls per conversation to keep things efficient and on-track. Most bookings should only need 4-8 calls (e.g., find provider, get locations, check availability, check history, book). If you're approaching the limit without progress, reassess your approach. You'll get a warning at 6 calls.
-
-TONE:
-Professional, helpful, efficient. Nurses are busy - be concise and proactive. After you book an appointment, provide clear confirmation with all the details (provider, location, date, time, appointment type, arrival time)."""
-
-# Tool function mapping
-TOOL_FUNCTIONS = {
-    "get_providers_by_specialty": get_providers_by_specialty,
-    "get_provider_locations": get_provider_locations,
-    "get_available_times": get_available_times,
-    "check_appointment_history": check_appointment_history,
-    "check_insurance": check_insurance,
-    "get_self_pay_rate": get_self_pay_rate,
-    "set_patient_insurance": set_patient_insurance,
-    "book_appointment": book_appointment,
-    "query_database": query_database
-}
+# Greeting for patients with accepted insurance and no referrals: nothing for the model
+# to look up or summarize, so it is rendered directly instead of calling the model
+TEMPLATE_GREETING = "Hi! I'm here to help book an appointment for {name}. What details can you provide to get started?"
+
+# Free-form SQL tool (query_database). Off by default: its schema costs prompt tokens on
+# every request and invites slow, error-prone queries over the purpose-built tools.
+ENABLE_RAW_SQL = os.getenv("ENABLE_RAW_SQL") == "1"
+
+# System prompt for Care Coordinator Agent, in three parts:
+# ROLE_PROMPT is sent on every call, first and byte-identical, so it stays in the cached prefix.
+# BOOKING_RULES is sent until an appointment is booked, TONE_HINT only for the first
+# TONE_HINT_TURNS nurse messages. Both go after the conversation, with the booking state.
+ROLE_PROMPT = """You are a Care Coordinator Assistant helping hospital nurses book patient appointments.
+
+CONTEXT:
+- The patient's information (name, DOB, PCP, referrals, appointment history, insurance, notes) is in the context.
+- The nurse may know more from the patient, or be working it out as they go. Help them book the best appointment for the patient's needs, not just any appointment - efficiently, but without cutting corners or making assumptions.
+- Tools cover providers, locations, availability, appointment history, insurance and self-pay rates""" + ("; query_database runs custom SELECTs when none fit." if ENABLE_RAW_SQL else ".") + """
+- Insurance: if missing or not accepted, the patient self-pays (get_self_pay_rate). New insurance from the nurse goes through intake_insurance, which also quotes the self-pay rate if needed.
+- Limit: 10 tool calls per conversation (most bookings need 4-8; warning at 6). Reassess if you're not making progress.
+- After booking, confirm provider, location, date, time, appointment type and arrival time."""
+
+BOOKING_RULES = """BOOKING RULES:
+- Booking needs provider, department/location (providers can work at several), appointment type (NEW/ESTABLISHED via check_appointment_history), date and time (get_available_times), optional notes.
+- Decide each step whether to look things up yourself or ask the nurse. Ask when the patient's needs or preferences are unclear, or a specific detail would narrow the options.
+- With several options (providers, locations, time slots), present them clearly and let the nurse choose.
+- Before booking, confirm the final details (provider and department IDs, date as YYYY-MM-DD, time as HH:MM) and wait for a yes, e.g. "Ready to book: Dr. Smith (provider ID 3) at Main Campus (department ID 2) on 2025-02-03 at 14:00, NEW patient appointment. Should I proceed?\""""
 
-# Tool definitions for OpenAI (native function calling format)
-TOOLS = [
+TONE_HINT = "TONE: Be professional and concise; nurses are busy."
+TONE_HINT_TURNS = 2
+
+# Full prompt, for anything that wants the whole instruction set in one string
+SYSTEM_PROMPT = "\n\n".join([ROLE_PROMPT, BOOKING_RULES, TONE_HINT])
+
+# Default seconds a cacheable read tool's result is reused within a session
+TOOL_RESULT_CACHE_TTL = 60
+
+# Tool specs - single source for the OpenAI schemas (TOOLS), dispatch table
+# (TOOL_FUNCTIONS) and execution policy (TOOL_POLICIES)
+# function: "module:attribute" of the implementation, imported on first dispatch
+# side_effects: tool writes to the database, so it must run in order, never in parallel
+# cache_ttl: seconds a result is reused for the same arguments within a session (0 = never cached).
+#            Only pure reads are cached; any side-effecting call clears the session's cache.
+# advanced: only offered to the model when ENABLE_RAW_SQL is set
+# Parameter schemas shared by several tools (one dict instead of a copy per tool)
+_PATIENT_ID_PARAM = {"type": "integer", "description": "The patient's ID number"}
+_PROVIDER_ID_PARAM = {"type": "integer", "description": "The provider's ID number"}
+_DEPARTMENT_ID_PARAM = {"type": "integer", "description": "The department/location ID"}
+
+_TOOL_SPECS = [
     {
-        "type": "function",
-        "function": {
-            "name": "get_providers_by_specialty",
-            "description": "Find all providers with a specific specialty (e.g., 'Orthopedics', 'Primary Care', 'Surgery'). Returns list of providers with their IDs, names, and certifications.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "specialty": {
-                        "type": "string",
-                        "description": "The medical specialty to search for"
-                    }
-                },
-                "required": ["specialty"]
+        "name": "get_providers_by_specialty",
+        "function": "tools:get_providers_by_specialty",
+        "side_effects": False,
+        "cache_ttl": TOOL_RESULT_CACHE_TTL,
+        "description": "Find providers with a specialty (e.g., 'Orthopedics', 'Primary Care', 'Surgery'), with their IDs, names and certifications.",
+        "properties": {
+            "specialty": {
+                "type": "string",
+                "description": "The medical specialty to search for"
             }
-        }
+        },
+        "required": ["specialty"]
     },
     {
-        "type": "function",
-        "function": {
-            "name": "get_provider_locations",
-            "description": "Get all locations where a specific provider works, including addresses, phone numbers, and office hours.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "provider_id": {
-                        "type": "integer",
-                        "description": "The provider's ID number"
-                    }
-                },
-                "required": ["provider_id"]
-            }
-        }
+        "name": "get_provider_locations",
+        "function": "tools:get_provider_locations",
+        "side_effects": False,
+        "cache_ttl": TOOL_RESULT_CACHE_TTL,
+        "description": "Get the locations where a provider works, with addresses, phone numbers and office hours.",
+        "properties": {
+            "provider_id": _PROVIDER_ID_PARAM
+        },
+        "required": ["provider_id"]
     },
     {
-        "type": "function",
-        "function": {
-            "name": "get_available_times",
-            "description": "Get available appointment times for a provider at a specific location. Can check a single date or date range. Returns office hours and currently booked times.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "provider_id": {
-                        "type": "integer",
-                        "description": "The provider's ID number"
-                    },
-                    "department_id": {
-                        "type": "integer",
-                        "description": "The department/location ID"
-                    },
-                    "start_date": {
-                        "type": "string",
-                        "description": "This paramater is a date in YYYY-MM-DD format, and can mean two different things. If the end_date (optional, subsequent paramater) is provided, this paramater is the start date of the date range. If the end_date is not provided, this paramater is the single date to check for available times."
-                    },
-                    "end_date": {
-                        "type": "string",
-                        "description": "Optional end date for checking a range, in YYYY-MM-DD format"
-                    }
-                },
-                "required": ["provider_id", "department_id", "start_date"]
+        "name": "get_available_times",
+        "function": "tools:get_available_times",
+        "side_effects": False,
+        "cache_ttl": TOOL_RESULT_CACHE_TTL,
+        "description": "Get office hours and booked times for a provider at a location; ALWAYS pass end_date for more than one day instead of repeated single-day calls.",
+        "properties": {
+            "provider_id": _PROVIDER_ID_PARAM,
+            "department_id": _DEPARTMENT_ID_PARAM,
+            "start_date": {
+                "type": "string",
+                "description": "Date to check in YYYY-MM-DD format (the start of the range if end_date is given)"
+            },
+            "end_date": {
+                "type": "string",
+                "description": "Optional end date for checking a range, in YYYY-MM-DD format"
             }
-        }
+        },
+        "required": ["provider_id", "department_id", "start_date"]
     },
     {
-        "type": "function",
-        "function": {
-            "name": "check_appointment_history",
-            "description": "Check if patient has seen a specific provider in the last 5 years. This determines if the appointment should be NEW (patient hasn't seen provider in 5+ years) or ESTABLISHED (patient has seen provider recently). Use this before booking to determine appointment type.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "patient_id": {
-                        "type": "integer",
-                        "description": "The patient's ID number"
-                    },
-                    "provider_id": {
-                        "type": "integer",
-                        "description": "The provider's ID number"
-                    }
-                },
-                "required": ["patient_id", "provider_id"]
+        "name": "check_appointment_history",
+        "function": "tools:check_appointment_history",
+        "side_effects": False,
+        "cache_ttl": TOOL_RESULT_CACHE_TTL,
+        "description": "Check whether the patient has seen a provider in the last 5 years (ESTABLISHED) or not (NEW); use before booking to set the appointment type.",
+        "properties": {
+            "patient_id": _PATIENT_ID_PARAM,
+            "provider_id": _PROVIDER_ID_PARAM
+        },
+        "required": ["patient_id", "provider_id"]
+    },
+    {
+        "name": "check_insurance",
+        "function": "tools:check_insurance",
+        "side_effects": False,
+        "cache_ttl": TOOL_RESULT_CACHE_TTL,
+        "description": "Check whether an insurance is accepted, listing the accepted insurances if it isn't found.",
+        "properties": {
+            "insurance_name": {
+                "type": "string",
+                "description": "The insurance provider name (e.g., 'Aetna', 'Blue Cross')"
             }
-        }
+        },
+        "required": ["insurance_name"]
     },
     {
-        "type": "function",
-        "function": {
-            "name": "check_insurance",
-            "description": "Check if a specific insurance is accepted. Returns whether the insurance is accepted and provides list of accepted insurances if not found.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "insurance_name": {
-                        "type": "string",
-                        "description": "The insurance provider name (e.g., 'Aetna', 'Blue Cross')"
-                    }
-                },
-                "required": ["insurance_name"]
+        "name": "get_self_pay_rate",
+        "function": "tools:get_self_pay_rate",
+        "side_effects": False,
+        "cache_ttl": TOOL_RESULT_CACHE_TTL,
+        "description": "Get the self-pay cost of a specialty for a patient paying out of pocket.",
+        "properties": {
+            "specialty": {
+                "type": "string",
+                "description": "The medical specialty (e.g., 'Primary Care', 'Orthopedics')"
             }
-        }
+        },
+        "required": ["specialty"]
     },
     {
-        "type": "function",
-        "function": {
-            "name": "get_self_pay_rate",
-            "description": "Get the self-pay cost for a specific medical specialty if patient is paying out of pocket.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "specialty": {
-                        "type": "string",
-                        "description": "The medical specialty (e.g., 'Primary Care', 'Orthopedics')"
-                    }
-                },
-                "required": ["specialty"]
+        "name": "set_patient_insurance",
+        "function": "tools:set_patient_insurance",
+        "side_effects": True,
+        "cache_ttl": 0,
+        "description": "Set a patient's insurance only, adding unknown insurances as not accepted (prefer intake_insurance, which also quotes self-pay).",
+        "properties": {
+            "patient_id": _PATIENT_ID_PARAM,
+            "insurance_name": {
+                "type": "string",
+                "description": "The insurance provider name (e.g., 'Aetna', 'Cigna')"
             }
-        }
+        },
+        "required": ["patient_id", "insurance_name"]
     },
     {
-        "type": "function",
-        "function": {
-            "name": "set_patient_insurance",
-            "description": "Set or update a patient's insurance. Use this when nurse provides insurance information. If the insurance doesn't exist in our system, it will be added (marked as not accepted). Returns whether the insurance is accepted or if patient will need to self-pay.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "patient_id": {
-                        "type": "integer",
-                        "description": "The patient's ID number"
-                    },
-                    "insurance_name": {
-                        "type": "string",
-                        "description": "The insurance provider name (e.g., 'Aetna', 'Cigna')"
-                    }
-                },
-                "required": ["patient_id", "insurance_name"]
+        "name": "intake_insurance",
+        "function": "tools:intake_insurance",
+        "side_effects": True,
+        "cache_ttl": 0,
+        "description": "Set the patient's insurance (adding unknown ones as not accepted) and report whether it's accepted, with the specialty's self-pay rate if not; prefer this over set_patient_insurance plus get_self_pay_rate.",
+        "properties": {
+            "patient_id": _PATIENT_ID_PARAM,
+            "insurance_name": {
+                "type": "string",
+                "description": "The insurance provider name (e.g., 'Aetna', 'Cigna')"
+            },
+            "specialty": {
+                "type": "string",
+                "description": "Optional specialty of the appointment, used to quote a self-pay rate if the insurance isn't accepted"
             }
-        }
+        },
+        "required": ["patient_id", "insurance_name"]
     },
     {
-        "type": "function",
-        "function": {
-            "name": "book_appointment",
-            "description": "Book an appointment (FINAL ACTION). Only call this once you have confirmed all details with the nurse: provider, location, appointment type (NEW/ESTABLISHED), date, and time. This actually creates the appointment in the system.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "patient_id": {
-                        "type": "integer",
-                        "description": "The patient's ID number"
-                    },
-                    "provider_id": {
-                        "type": "integer",
-                        "description": "The provider's ID number"
-                    },
-                    "department_id": {
-                        "type": "integer",
-                        "description": "The department/location ID"
-                    },
-                    "appointment_type": {
-                        "type": "string",
-                        "description": "Either 'NEW' or 'ESTABLISHED' - must be determined using check_appointment_history first"
-                    },
-                    "date": {
-                        "type": "string",
-                        "description": "Appointment date in YYYY-MM-DD format"
-                    },
-                    "appointment_time": {
-                        "type": "string",
-                        "description": "Appointment time in HH:MM format (24-hour)"
-                    },
-                    "notes": {
-                        "type": "string",
-                        "description": "Optional notes about the appointment"
-                    }
-                },
-                "required": ["patient_id", "provider_id", "department_id", "appointment_type", "date", "appointment_time"]
+        "name": "book_appointment",
+        "function": "tools:book_appointment",
+        "side_effects": True,
+        "cache_ttl": 0,
+        "description": "Create the appointment (FINAL ACTION); only call once the nurse has confirmed provider, location, appointment type, date and time.",
+        "properties": {
+            "patient_id": _PATIENT_ID_PARAM,
+            "provider_id": _PROVIDER_ID_PARAM,
+            "department_id": _DEPARTMENT_ID_PARAM,
+            "appointment_type": {
+                "type": "string",
+                "description": "Either 'NEW' or 'ESTABLISHED' - must be determined using check_appointment_history first"
+            },
+            "date": {
+                "type": "string",
+                "description": "Appointment date in YYYY-MM-DD format"
+            },
+            "appointment_time": {
+                "type": "string",
+                "description": "Appointment time in HH:MM format (24-hour)"
+            },
+            "notes": {
+                "type": "string",
+                "description": "Optional notes about the appointment"
             }
-        }
+        },
+        "required": ["patient_id", "provider_id", "department_id", "appointment_type", "date", "appointment_time"]
     },
+    {
+        "name": "query_database",
+        "function": "tools:query_database",
+        "side_effects": False,
+        "cache_ttl": 0,
+        "advanced": True,
+        "description": "Run a SQL SELECT only for aggregations or joins the other tools can't express; MUST use %s params and a LIMIT, a WHERE on appointments/patients/referrals, and IN (...) rather than one query per id.",
+        "properties": {
+            "sql": {
+                "type": "string",
+                "description": "SQL SELECT query to execute"
+            },
+            "params": {
+                "type": "array",
+                "description": "Optional list of parameters for parameterized query",
+                "items": {
+                    "type": "string"
+                }
+            }
+        },
+        "required": ["sql"]
+    }
+]
+
+# Advanced tools are left out entirely unless enabled, so they have no schema, dispatch entry or policy
+if not ENABLE_RAW_SQL:
+    _TOOL_SPECS = [spec for spec in _TOOL_SPECS if not spec.get("advanced")]
+
+# Sorted once so the tool schemas (part of the cached prompt prefix) are always sent in the same order
+_TOOL_SPECS.sort(key=lambda spec: spec["name"])
+
+# Interned so the schemas, TOOL_FUNCTIONS and TOOL_POLICIES all share one string object per name
+for spec in _TOOL_SPECS:
+    spec["name"] = sys.intern(spec["name"])
+
+# Tool definitions for OpenAI (native function calling format).
+# Stored as a tuple so no code path can reorder or extend it after import.
+TOOLS = tuple(
     {
         "type": "function",
         "function": {
-            "name": "query_database",
-            "description": "Execute a custom SQL SELECT query for flexibility when other tools don't fit the need. Use this for complex queries or when you need specific information not covered by other tools. Only SELECT queries are allowed.",
+            "name": spec["name"],
+            "description": spec["description"],
             "parameters": {
                 "type": "object",
-                "properties": {
-                    "sql": {
-                        "type": "string",
-                        "description": "SQL SELECT query to execute"
-                    },
-                    "params": {
-                        "type": "array",
-                        "description": "Optional list of parameters for parameterized query",
-                        "items": {
-                            "type": "string"
-                        }
-                    }
-                },
-                "required": ["sql"]
+                "properties": spec["properties"],
+                "required": spec["required"]
             }
         }
     }
-]
+    for spec in _TOOL_SPECS
+)
+
+# TOOLS serialized once (compact JSON bytes) for anything that needs the payload itself,
+# e.g. measuring the cached prefix. The OpenAI client still gets TOOLS: its encoder only
+# accepts plain dicts/lists, so the schemas can't be swapped for frozen mapping proxies.
+TOOLS_JSON = json.dumps(TOOLS, separators=(",", ":")).encode()
+TOOLS_SHA = hashlib.sha1(TOOLS_JSON).hexdigest()
+
+
+# Tool calling for models without native function calling (see PROMPT_TOOL_MODEL_PREFIXES)
+TOOL_CALL_PROMPT = """TOOLS:
+To call a tool, reply with only <tool_call>{"name": "<tool name>", "arguments": {...}}</tool_call>
+(one envelope per call; several calls may go in one reply). Each result comes back in a
+<tool_result> message. Available tools, as JSON schemas:
+""" + TOOLS_JSON.decode()
+
+
+def get_tools_payload() -> bytes:
+    """Serialized TOOLS, computed once at import."""
+    return TOOLS_JSON
+
+# Tool function mapping (imports the tool implementations on first use, so code that
+# only needs prompts or schemas doesn't pay for them)
+@lru_cache(maxsize=None)
+def get_tool_functions() -> Dict[str, Callable]:
+    """Resolve every tool spec's function, importing its module on first call."""
+    functions = {}
+    for spec in _TOOL_SPECS:
+        module_name, attribute = spec["function"].split(":")
+        functions[spec["name"]] = getattr(importlib.import_module(module_name), attribute)
+    return functions
+
+
+def __getattr__(name: str):
+    """Build TOOL_FUNCTIONS lazily on first access (PEP 562)."""
+    if name == "TOOL_FUNCTIONS":
+        return get_tool_functions()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Per-tool execution policy (kept out of TOOLS, which is sent to OpenAI as-is)
+TOOL_POLICIES = {
+    spec["name"]: {"side_effects": spec["side_effects"], "cache_ttl": spec["cache_ttl"]}
+    for spec in _TOOL_SPECS
+}
+
+# Per-tool argument signatures, precomputed from the schemas so arguments from the model
+# are checked before dispatch (a bad call fails fast instead of reaching the API)
+_JSON_TYPES = {"integer": int, "number": (int, float), "string": str, "boolean": bool, "array": list, "object": dict}
+
+TOOL_SIGNATURES = {
+    spec["name"]: {
+        "required": frozenset(spec["required"]),
+        "types": {name: _JSON_TYPES[schema["type"]] for name, schema in spec["properties"].items()}
+    }
+    for spec in _TOOL_SPECS
+}
+
+# Prompt caching
+# OpenAI caches prompt prefixes of at least 1024 tokens. If the system prompt + tools
+# come in under that, the fixed block below is appended so the prefix still caches.
+PROMPT_CACHE_MIN_TOKENS = 1024
+PROMPT_CACHE_PADDING = """BOOKING REFERENCE:
+- Dates are always YYYY-MM-DD and times are 24-hour HH:MM when calling tools.
+- NEW patients should arrive 30 minutes early; ESTABLISHED patients 10 minutes early.
+- Only book within the location's office hours and never on a time already booked.
+- A provider can work at several locations; always confirm which location with the nurse.
+- If insurance is not accepted, quote the self-pay rate for the specialty before booking."""
+
+# First system message of every conversation. OpenAI renders TOOLS ahead of it, so
+# tools + this block form the cached prefix shared by all sessions. Keep it free of
+# patient data and timestamps; per-patient context goes in the messages after it.
+CACHED_SYSTEM_BLOCK = ROLE_PROMPT
+
+# Sent as prompt_cache_key so OpenAI routes every session to the same cache entry.
+# Changes whenever the tools or the cached block do, so stale entries aren't shared.
+PROMPT_CACHE_KEY = "care-coordinator-" + hashlib.sha1(TOOLS_JSON + CACHED_SYSTEM_BLOCK.encode()).hexdigest()[:16]
 
 # Agent settings
 MAX_ITERATIONS = 10
 WARNING_THRESHOLD = 6
-MODEL = "gpt-4"  # or "gpt-4-turbo" or "gpt-3.5-turbo"
+MODEL = os.getenv("AGENT_MODEL", "gpt-4o-mini")  # or "gpt-4o", "gpt-4.1-mini", "gpt-4"
+TEMPERATURE = 0
+# Reasoning models only accept the default temperature, so it isn't sent to them
+DEFAULT_TEMPERATURE_MODEL_PREFIXES = ("o1", "o3", "o4", "gpt-5")
+
+# Booking confirmation fast path
+# When the last reply was a "Ready to book: ..." confirmation and the nurse answers with one
+# of these, the booking is made directly and answered from the template (no model call).
+CONFIRMATION_REPLIES = frozenset({"yes", "y", "yes please", "confirm", "book it", "go ahead", "proceed"})
+BOOKED_RESPONSE_TEMPLATE = (
+    "Booked: {provider} at {location} on {date} at {appointment_time}, {type} patient appointment. "
+    "Please have the patient arrive by {arrival_time}."
+)
+
+# Agent log level (logs go through a background thread, see agent.configure_logging)
+LOG_LEVEL = os.getenv("AGENT_LOG_LEVEL", "WARNING")
+
+# Models without native function calling get TOOL_CALL_PROMPT in their system message and
+# call tools with <tool_call> envelopes; every other model gets TOOLS through the API.
+# Comma-separated model name prefixes (add e.g. a self-hosted model behind an OpenAI-compatible API)
+PROMPT_TOOL_MODEL_PREFIXES = tuple(
+    prefix.strip() for prefix in os.getenv("PROMPT_TOOL_MODEL_PREFIXES", "o1-mini,o1-preview").split(",") if prefix.strip()
+)
+
+# Run independent read-only tool calls concurrently (chat, streaming and greeting).
+# Tools with side_effects always run one at a time, in order.
+ENABLE_PARALLEL_TOOL_EXECUTION = True
+
+# Response length budget (max_tokens) per model call
+# Most replies are 50-200 tokens, so the full budget is only offered when the model is
+# answering a fresh nurse message. A call right after tool results is usually another
+# short tool call or a reply relaying those results, and the last allowed iteration
+# should wrap up briefly; both get the smaller budget (sized to fit a list of open slots).
+MAX_TOKENS = 1000
+MAX_TOKENS_AFTER_TOOLS = 400
+
+# Conversation memory
+# Only the last MEMORY_WINDOW_SIZE messages are sent verbatim; older turns are
+# folded into a running summary written by SUMMARY_MODEL.
+MEMORY_WINDOW_SIZE = 8
+SUMMARY_MODEL = "gpt-4o-mini"
+SUMMARY_PROMPT = "Summarize these turns preserving booking-relevant facts: patient needs, providers and IDs, locations and department IDs, appointment type, dates/times discussed, insurance status, and anything the nurse confirmed or rejected. Be concise."
+
+# Semantic response cache
+# Near-duplicate nurse messages (cosine similarity >= threshold) in the same booking
+# state reuse the earlier response instead of calling the model again.
+# Off by default: it adds an embeddings call to every nurse message.
+# Entries stay in memory unless SEMANTIC_CACHE_PATH is set; cached replies can contain
+# patient details (PHI), so only point it at storage that may hold them.
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED") == "1"
+SEMANTIC_CACHE_PATH = os.getenv("SEMANTIC_CACHE_PATH") or None
+SEMANTIC_CACHE_THRESHOLD = 0.92
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# Database (see db.py)
+# Read tools share this pool; sized to match the tool thread pool in agent.py
+DB_POOL_MAX_CONNECTIONS = 8
+# The pool closes a returned connection once this many are idle, so keep all of them open
+DB_POOL_MIN_CONNECTIONS = DB_POOL_MAX_CONNECTIONS
+# Prepare the tools' fixed queries once per connection (PREPARE/EXECUTE). Needs a session
+# connection (direct, or Supabase's session pooler on port 5432): transaction poolers
+# like the 6543 pooler don't keep prepared statements between transactions.
+DB_PREPARE_STATEMENTS = os.getenv("DB_PREPARE_STATEMENTS") == "1"
+
+# Flask API (tools' HTTP calls share one keep-alive client, see tools._get_client)
+# Sized to match the tool thread pool in agent.py
+API_POOL_CONNECTIONS = 8
+API_TIMEOUT_S = 10.0
+# Queries per /api/batch request (the API's BATCH_MAX_QUERIES); larger batches are split
+API_BATCH_MAX_QUERIES = 32
+
+# Reference data cache (see tools._TTLCache)
+# Insurance, self-pay rate, provider and department-hours lookups are shared across
+# sessions for REFERENCE_CACHE_TTL_S; set_patient_insurance clears the insurance entries
+REFERENCE_CACHE_MAXSIZE = 512
+REFERENCE_CACHE_TTL_S = 300
+
+# Batch loaders (see loaders.py)
+# By-ID lookups from tool calls running concurrently within this window share one query
+LOADER_BATCH_WAIT_S = 0.002
+
+# OpenAI client
+# Transient errors (429, 5xx, connection drops) are retried inside the client with
+# exponential backoff, so a provider blip doesn't fail the nurse's whole turn.
+OPENAI_MAX_RETRIES = 3
+OPENAI_TIMEOUT_S = 30.0
+OPENAI_CONNECT_TIMEOUT_S = 3.0
 
 # Warning system message
 WARNING_MESSAGE = "Note: You have made 6 tool calls. Most tasks should complete in 4-8 calls, and your limit is 10. Keep this in mind as you continue to drive towards booking an appointment while being helpful to the nurse."
\ No newline at end of file
@@ -0,0 +1,110 @@
+"""
+Direct database access for Care Coordinator Agent tools.
+Read queries go straight to PostgreSQL over a shared connection pool instead of
+through the Flask API's /api/query endpoint.
+"""
+
+import os
+import re
+import threading
+import weakref
+from datetime import date, time, datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Set
+from dotenv import load_dotenv
+import psycopg2
+from psycopg2.extras import RealDictCursor
+from psycopg2.pool import ThreadedConnectionPool
+
+from config import DB_POOL_MIN_CONNECTIONS, DB_POOL_MAX_CONNECTIONS, DB_PREPARE_STATEMENTS
+
+load_dotenv()
+
+CONNECTION_STRING = os.getenv('POSTGRES_CONNECTION_STRING')
+
+_pool: Optional[ThreadedConnectionPool] = None
+_pool_lock = threading.Lock()
+
+# ThreadedConnectionPool raises PoolError once every connection is out instead of waiting,
+# so callers take a slot first and queue here when the pool is busy
+_pool_slots = threading.BoundedSemaphore(DB_POOL_MAX_CONNECTIONS)
+
+# Statement names already prepared on each pooled connection, {connection: {name}}.
+# Weakly keyed, so the entry goes away with the connection however the pool closes it
+_prepared: "weakref.WeakKeyDictionary[Any, Set[str]]" = weakref.WeakKeyDictionary()
+
+PLACEHOLDER_RE = re.compile(r'%s')
+
+
+def is_configured() -> bool:
+    """Whether a direct database connection is available (otherwise tools go through the API)."""
+    return bool(CONNECTION_STRING)
+
+
+def _get_pool() -> ThreadedConnectionPool:
+    """Get the shared connection pool (created on first use)."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadedConnectionPool(DB_POOL_MIN_CONNECTIONS, DB_POOL_MAX_CONNECTIONS, CONNECTION_STRING)
+    return _pool
+
+
+def query(sql: str, params: Optional[List] = None, name: Optional[str] = None) -> List[Dict]:
+    """
+    Run a query in a read-only transaction and return rows as dicts.
+    Waits for a free connection when all DB_POOL_MAX_CONNECTIONS are in use.
+    Values are converted the way the API's JSON responses render them, so results
+    look the same whichever path a tool takes.
+    With DB_PREPARE_STATEMENTS, a named query is prepared once per connection and
+    then run with EXECUTE, so Postgres parses and plans it only once.
+    """
+    params = params or []
+    pool = _get_pool()
+    with _pool_slots:
+        conn = pool.getconn()
+        discard = False
+        try:
+            # BEGIN READ ONLY per transaction (works through Supabase's transaction pooler)
+            conn.set_session(readonly=True)
+            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                if name and DB_PREPARE_STATEMENTS:
+                    _execute_prepared(cursor, conn, name, sql, params)
+                else:
+                    cursor.execute(sql, params)
+                rows = cursor.fetchall()
+            conn.rollback()
+        except psycopg2.Error:
+            # The connection's prepared statements are unknown after a failure, so don't reuse it
+            discard = name is not None and DB_PREPARE_STATEMENTS
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            if discard:
+                _prepared.pop(conn, None)
+            pool.putconn(conn, close=discard or bool(conn.closed))
+    
+    return [{key: _json_value(value) for key, value in row.items()} for row in rows]
+
+
+def _execute_prepared(cursor, conn, name: str, sql: str, params: List):
+    """EXECUTE a named statement, preparing it first if this connection hasn't yet."""
+    prepared = _prepared.setdefault(conn, set())
+    if name not in prepared:
+        numbered = iter(range(1, len(params) + 1))
+        cursor.execute(f"PREPARE {name} AS " + PLACEHOLDER_RE.sub(lambda _: f"${next(numbered)}", sql))
+        prepared.add(name)
+    cursor.execute(f"EXECUTE {name}({', '.join(['%s'] * len(params))})" if params else f"EXECUTE {name}", params)
+
+
+def _json_value(value: Any) -> Any:
+    """Dates/times as ISO strings and NUMERIC as strings (also inside arrays), matching the API's JSON."""
+    if isinstance(value, list):
+        return [_json_value(item) for item in value]
+    if isinstance(value, (date, time, datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
@@ -0,0 +1,105 @@
+"""
+Batch loaders for Care Coordinator Agent tools.
+Coalesces by-ID lookups made by concurrent tool calls into one query per batch,
+and memoizes results for the rest of the agent turn.
+"""
+
+import time
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Optional
+
+from config import LOADER_BATCH_WAIT_S
+
+# Load function: list of keys -> {key: value}; keys missing from the result load as None
+LoadFunction = Callable[[List[Hashable]], Dict[Hashable, Any]]
+
+
+class BatchLoader:
+    """
+    Loads values by key for concurrent callers (tool calls run in a thread pool).
+    The first caller waits batch_wait_s for others to join, then runs load_fn once
+    for every key queued so far; each key is loaded at most once per loader.
+    """
+
+    def __init__(self, load_fn: LoadFunction, batch_wait_s: float = LOADER_BATCH_WAIT_S):
+        self.load_fn = load_fn
+        self.batch_wait_s = batch_wait_s
+        self.results: Dict[Hashable, Future] = {}
+        self.queued: List[Hashable] = []
+        self.lock = threading.Lock()
+
+    def load(self, key: Hashable) -> Any:
+        """Return the value for key, batching with concurrent loads."""
+        with self.lock:
+            future = self.results.get(key)
+            leader = future is None and not self.queued
+            if future is None:
+                future = self.results[key] = Future()
+                self.queued.append(key)
+
+        if leader:
+            time.sleep(self.batch_wait_s)  # Let concurrent tool calls join this batch
+            self._dispatch()
+
+        return future.result()
+
+    def _dispatch(self):
+        """Run load_fn for the queued keys and resolve their futures."""
+        with self.lock:
+            keys, self.queued = self.queued, []
+            futures = [self.results[key] for key in keys]
+
+        try:
+            values = self.load_fn(keys)
+        except Exception as e:
+            with self.lock:
+                for key in keys:
+                    self.results.pop(key, None)  # Not memoized, so a later call can retry
+            for future in futures:
+                future.set_exception(e)
+            return
+
+        for key, future in zip(keys, futures):
+            future.set_result(values.get(key))
+
+
+class RequestLoaders:
+    """The BatchLoaders for one agent turn, one per load function (created on first use)."""
+
+    def __init__(self):
+        self.loaders: Dict[LoadFunction, BatchLoader] = {}
+        self.lock = threading.Lock()
+
+    def get(self, load_fn: LoadFunction) -> BatchLoader:
+        with self.lock:
+            loader = self.loaders.get(load_fn)
+            if loader is None:
+                loader = self.loaders[load_fn] = BatchLoader(load_fn)
+            return loader
+
+
+_current: ContextVar[Optional[RequestLoaders]] = ContextVar("request_loaders", default=None)
+
+
+@contextmanager
+def use_loaders(request_loaders: RequestLoaders) -> Iterator[RequestLoaders]:
+    """Make request_loaders current for tool calls in this context (the tool's worker thread)."""
+    token = _current.set(request_loaders)
+    try:
+        yield request_loaders
+    finally:
+        _current.reset(token)
+
+
+def load(load_fn: LoadFunction, key: Hashable) -> Any:
+    """
+    Load key through the current turn's loader for load_fn.
+    Outside an agent turn (tools called directly) this is a plain single-key load.
+    """
+    request_loaders = _current.get()
+    if request_loaders is None:
+        return load_fn([key]).get(key)
+    return request_loaders.get(load_fn).load(key)
@@ -0,0 +1,117 @@
+"""
+Semantic response cache for Care Coordinator Agent.
+Reuses assistant responses for near-duplicate nurse messages in the same booking state.
+"""
+
+import os
+import json
+import math
+import atexit
+import logging
+import threading
+from typing import List, Dict, Optional
+
+logger = logging.getLogger("agent.semantic_cache")
+
+
+class SemanticCache:
+    """
+    In-process cache of assistant responses keyed by (message embedding, booking state).
+    Entries are bucketed by state hash and matched by cosine similarity.
+    With a path, entries are also saved to a JSON file (at most every flush_interval_s seconds,
+    from a background thread) so they survive restarts. Responses can contain patient details,
+    so only pass a path for a file that may hold PHI, and only one process should use a file.
+    """
+
+    def __init__(self, path: Optional[str] = None, threshold: float = 0.92, max_entries: int = 1000,
+                 flush_interval_s: float = 30.0):
+        self.path = path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.flush_interval_s = flush_interval_s
+        self.entries: Dict[str, List[Dict]] = {}  # {state_hash: [{"embedding": [...], "response": str}]}
+        self.lock = threading.Lock()
+        self._dirty = False
+        self._flush_timer: Optional[threading.Timer] = None
+        if path:
+            self._load()
+            atexit.register(self.flush)
+
+    def get(self, embedding: List[float], state_hash: str) -> Optional[str]:
+        """Return cached response for the most similar message in this state, if above threshold."""
+        query = _normalize(embedding)
+
+        best_score = 0.0
+        best_response = None
+
+        with self.lock:
+            for entry in self.entries.get(state_hash, []):
+                score = sum(a * b for a, b in zip(query, entry['embedding']))
+                if score > best_score:
+                    best_score = score
+                    best_response = entry['response']
+
+        if best_score >= self.threshold:
+            return best_response
+        return None
+
+    def set(self, embedding: List[float], state_hash: str, response: str):
+        """Add a response to the cache (saved by the next background flush, if persisting)."""
+        with self.lock:
+            self.entries.setdefault(state_hash, []).append({
+                "embedding": _normalize(embedding),
+                "response": response
+            })
+
+            # Drop oldest state buckets once over capacity
+            while sum(len(bucket) for bucket in self.entries.values()) > self.max_entries:
+                del self.entries[next(iter(self.entries))]
+
+            if self.path:
+                self._dirty = True
+                if self._flush_timer is None:
+                    self._flush_timer = threading.Timer(self.flush_interval_s, self.flush)
+                    self._flush_timer.daemon = True
+                    self._flush_timer.start()
+
+    def flush(self):
+        """Save entries added since the last flush (no-op without a path or new entries)."""
+        with self.lock:
+            self._flush_timer = None
+            if not self._dirty:
+                return
+            self._dirty = False
+            # Entries are never modified once added, so a shallow copy is a consistent snapshot
+            snapshot = {state_hash: list(bucket) for state_hash, bucket in self.entries.items()}
+
+        self._save(snapshot)
+
+    def _load(self):
+        """Load cache entries from disk (missing or corrupt file means empty cache)."""
+        if not os.path.exists(self.path):
+            return
+
+        try:
+            with open(self.path, 'r') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Could not load semantic cache from %s: %s", self.path, e)
+            self.entries = {}
+
+    def _save(self, entries: Dict[str, List[Dict]]):
+        """Write cache entries to disk atomically."""
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning("Could not save semantic cache to %s: %s", self.path, e)
+
+
+def _normalize(embedding: List[float]) -> List[float]:
+    """Scale vector to unit length so cosine similarity is a dot product."""
+    norm = math.sqrt(sum(x * x for x in embedding))
+    if norm == 0:
+        return list(embedding)
+    return [x / norm for x in embedding]
@@ -1,15 +1,300 @@
 """
 Tool implementations for Care Coordinator Agent.
-Each tool makes HTTP requests to the Flask API.
+Read tools query PostgreSQL directly (see db.py) when a connection string is configured,
+otherwise through the Flask API; writes always go through the Flask API.
 """
 
-import requests
-from typing import Dict, List, Optional
+import os
+import re
+import sys
+import importlib.util
+import time
+import atexit
+import inspect
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from functools import lru_cache, wraps
+import httpx
+from typing import Any, Callable, Dict, Hashable, List, Optional
 from datetime import datetime, timedelta
 
+import db
+import loaders
+from config import API_BATCH_MAX_QUERIES, API_POOL_CONNECTIONS, API_TIMEOUT_S, LOADER_BATCH_WAIT_S, REFERENCE_CACHE_MAXSIZE, REFERENCE_CACHE_TTL_S
+
+# query_database checks model SQL with the same pglast validator as /api/query, since on the
+# direct database path that endpoint's check never runs
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "api"))
+from api_helpers import select_query_error
+
 API_BASE = 'http://localhost:5002'
 
+# query_database guard rails: every query needs a LIMIT, and queries touching
+# large tables need a WHERE clause (keeps the model from scanning whole tables)
+QUERY_LIMIT_RE = re.compile(r'\bLIMIT\s+\d+', re.IGNORECASE)
+QUERY_WHERE_RE = re.compile(r'\bWHERE\b', re.IGNORECASE)
+HIGH_CARDINALITY_TABLES_RE = re.compile(r'\b(appointments|patients|referrals)\b', re.IGNORECASE)
+
+# Fixed tool queries (prepared under the statement names their callers pass, see db.query)
+SQL_PROVIDERS_BY_SPECIALTY = """
+    SELECT p.id, p.first_name, p.last_name, p.certification, s.name as specialty
+    FROM providers p
+    JOIN specialties s ON p.specialty_id = s.id
+    WHERE s.name ILIKE %s
+"""
+
+SQL_PROVIDER_LOCATIONS = """
+    SELECT 
+        pd.provider_id,
+        d.id as department_id,
+        d.name as location_name,
+        d.address,
+        d.phone,
+        d.hours
+    FROM provider_departments pd
+    JOIN departments d ON pd.department_id = d.id
+    WHERE pd.provider_id = ANY(%s)
+"""
+
+# Grouped by date in the database: one row per date with its booked times
+SQL_BOOKED_TIMES = """
+    SELECT date, array_agg(appointment_time ORDER BY appointment_time) AS times
+    FROM appointments
+    WHERE provider_id = %s
+    AND department_id = %s
+    AND date BETWEEN %s AND %s
+    AND status = 'scheduled'
+    GROUP BY date
+"""
+
+SQL_APPOINTMENT_HISTORY = """
+    SELECT date, status
+    FROM appointments
+    WHERE patient_id = %s
+    AND provider_id = %s
+    AND date >= %s
+    AND status = 'completed'
+    ORDER BY date DESC
+    LIMIT 1
+"""
+
+SQL_INSURANCE_BY_NAME = "SELECT id, name, accepted FROM insurances WHERE name ILIKE %s"
+SQL_ACCEPTED_INSURANCES = "SELECT name FROM insurances WHERE accepted = TRUE"
+SQL_SELF_PAY_RATE = "SELECT name, self_pay_rate FROM specialties WHERE name ILIKE %s"
+
+
+class _TTLCache:
+    """
+    Bounded least-recently-used map with a time-to-live, shared by every session in the process.
+    Holds lookups on near-static reference tables (insurances, specialties, providers, departments).
+    """
+
+    def __init__(self, maxsize: int = REFERENCE_CACHE_MAXSIZE, ttl_s: float = REFERENCE_CACHE_TTL_S):
+        self.maxsize = maxsize
+        self.ttl_s = ttl_s
+        self.entries: "OrderedDict[Hashable, tuple]" = OrderedDict()  # {key: (stored_at, value)}
+        self.lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value, or None if missing or expired."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[0] > self.ttl_s:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: Hashable, value: Any):
+        with self.lock:
+            self.entries[key] = (time.monotonic(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+def _reference_cached(cache: _TTLCache) -> Callable:
+    """Cache a read tool's successful results in cache, keyed by its (bound) arguments."""
+    def decorator(tool_function: Callable) -> Callable:
+        signature = inspect.signature(tool_function)
+        
+        @wraps(tool_function)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = tuple(bound.arguments.values())
+            result = cache.get(key)
+            if result is None:
+                result = tool_function(*args, **kwargs)
+                if "error" not in result:
+                    cache.put(key, result)
+            return result
+        
+        return wrapper
+    return decorator
+
+
+# Invalidated by set_patient_insurance, which can add insurance records
+_insurance_cache = _TTLCache()
+_self_pay_cache = _TTLCache()
+_providers_cache = _TTLCache()
+_department_hours_cache = _TTLCache()
+
+
+_client: Optional[httpx.Client] = None
+_client_lock = threading.Lock()
+
+
+def _get_client() -> httpx.Client:
+    """
+    Get the shared HTTP client for API calls (created on first use).
+    Keeps connections to the API alive between tool calls instead of reconnecting each time,
+    and multiplexes them over HTTP/2 when h2 is installed and the API is served over TLS.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = httpx.Client(
+                    base_url=API_BASE,
+                    http2=importlib.util.find_spec("h2") is not None,
+                    limits=httpx.Limits(max_connections=API_POOL_CONNECTIONS, max_keepalive_connections=API_POOL_CONNECTIONS),
+                    timeout=API_TIMEOUT_S
+                )
+    return _client
+
+
+@atexit.register
+def close():
+    """Close the shared HTTP client and its pooled connections."""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+class _QueryBatcher:
+    """
+    Sends API queries from concurrent tool calls together as one /api/batch request.
+    The first caller waits batch_wait_s for others to join (like loaders.BatchLoader),
+    then posts every query queued so far (API_BATCH_MAX_QUERIES per request, the API's limit);
+    each caller gets its own result back.
+    """
+
+    def __init__(self, batch_wait_s: float = LOADER_BATCH_WAIT_S):
+        self.batch_wait_s = batch_wait_s
+        self.queued: List[tuple] = []  # [(query, Future)]
+        self.lock = threading.Lock()
+
+    def query(self, sql: str, params: Optional[List] = None) -> List[Dict]:
+        future = Future()
+        with self.lock:
+            self.queued.append(({'sql': sql, 'params': params or []}, future))
+            leader = len(self.queued) == 1
+
+        if leader:
+            time.sleep(self.batch_wait_s)  # Let concurrent tool calls join this batch
+            self._dispatch()
+
+        result = future.result()
+        if "error" in result:
+            raise RuntimeError(result["error"])
+        return result.get('results', [])
+
+    def _dispatch(self):
+        """Post the queued queries and hand each caller its entry of the response."""
+        with self.lock:
+            batch, self.queued = self.queued, []
+
+        for start in range(0, len(batch), API_BATCH_MAX_QUERIES):
+            self._post(batch[start:start + API_BATCH_MAX_QUERIES])
+
+    def _post(self, batch: List[tuple]):
+        """Post one /api/batch request; every caller in it gets a result or an exception."""
+        try:
+            response = _get_client().post(
+                '/api/batch',
+                json={'queries': [query for query, _ in batch]}
+            )
+            if response.status_code != 200:
+                raise RuntimeError(f"Query failed: {response.text}")
+            results = response.json()['results']
+            # Results are matched to callers by position, so a short or long list can't be trusted
+            if len(results) != len(batch):
+                raise RuntimeError(f"Batch returned {len(results)} results for {len(batch)} queries")
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+
+_query_batcher = _QueryBatcher()
+
+
+def _query(sql: str, params: Optional[List] = None, name: Optional[str] = None) -> List[Dict]:
+    """
+    Run a read query and return its rows: in-process when the database is configured,
+    else via the API (batched with concurrent tool calls' queries into one /api/batch request).
+    Raises on failure (tools report it as a tool error).
+    Fixed tool queries pass a statement name so the direct path can prepare them (see db.query).
+    """
+    if db.is_configured():
+        return db.query(sql, params, name=name)
+    
+    return _query_batcher.query(sql, params)
+
+
+def _load_provider_locations(provider_ids: List[int]) -> Dict[int, List[Dict]]:
+    """Batch load function: provider ID -> that provider's locations (with hours)."""
+    locations = {}
+    for row in _query(SQL_PROVIDER_LOCATIONS, [list(provider_ids)], name='provider_locations'):
+        locations.setdefault(row.pop('provider_id'), []).append(row)
+    return locations
+
+
+def _fetch_by_ids(table: str, ids: List[int], columns: List[str], name: Optional[str] = None) -> Dict[int, Dict]:
+    """
+    Rows of table for all of ids in one query (WHERE id = ANY), keyed by id.
+    table and columns are interpolated into the SQL, so they must be fixed names from this module.
+    """
+    sql = _by_ids_sql(table, tuple(columns))
+    return {row['id']: row for row in _query(sql, [list(ids)], name=name)}
+
+
+@lru_cache(maxsize=None)
+def _by_ids_sql(table: str, columns: tuple) -> str:
+    """The _fetch_by_ids query for a table and column list (built once per combination)."""
+    return f"SELECT id, {', '.join(columns)} FROM {table} WHERE id = ANY(%s)"
+
+
+def _load_department_hours(department_ids: List[int]) -> Dict[int, str]:
+    """Batch load function: department ID -> hours string."""
+    rows = _fetch_by_ids('departments', department_ids, ['hours'], name='department_hours')
+    return {department_id: row['hours'] for department_id, row in rows.items()}
+
+
+def _get_dept_hours(department_id: int) -> Optional[str]:
+    """A department's hours string (None if the department doesn't exist); cached, hours rarely change."""
+    hours = _department_hours_cache.get(department_id)
+    if hours is None:
+        hours = loaders.load(_load_department_hours, department_id)
+        if hours is not None:
+            _department_hours_cache.put(department_id, hours)
+    return hours
+
 
+@_reference_cached(_providers_cache)
 def get_providers_by_specialty(specialty: str) -> dict:
     """
     Find all providers with a given specialty.
@@ -22,23 +307,7 @@ def get_providers_by_specialty(specialty: str) -> dict:
     """
     try:
         # Query providers table filtered by specialty
-        sql = """
-            SELECT p.id, p.first_name, p.last_name, p.certification, s.name as specialty
-            FROM providers p
-            JOIN specialties s ON p.specialty_id = s.id
-            WHERE s.name ILIKE %s
-        """
-        
-        response = requests.post(
-            f'{API_BASE}/api/query',
-            json={'sql': sql, 'params': [specialty]}
-        )
-        
-        if response.status_code != 200:
-            return {"error": f"Failed to query providers: {response.text}"}
-        
-        data = response.json()
-        providers = data.get('results', [])
+        providers = _query(SQL_PROVIDERS_BY_SPECIALTY, [specialty], name='providers_by_specialty')
         
         if not providers:
             return {
@@ -67,28 +336,7 @@ def get_provider_locations(provider_id: int) -> dict:
         dict with list of locations and their details
     """
     try:
-        sql = """
-            SELECT 
-                d.id as department_id,
-                d.name as location_name,
-                d.address,
-                d.phone,
-                d.hours
-            FROM provider_departments pd
-            JOIN departments d ON pd.department_id = d.id
-            WHERE pd.provider_id = %s
-        """
-        
-        response = requests.post(
-            f'{API_BASE}/api/query',
-            json={'sql': sql, 'params': [provider_id]}
-        )
-        
-        if response.status_code != 200:
-            return {"error": f"Failed to query locations: {response.text}"}
-        
-        data = response.json()
-        locations = data.get('results', [])
+        locations = loaders.load(_load_provider_locations, provider_id)
         
         if not locations:
             return {
@@ -125,58 +373,20 @@ def get_available_times(provider_id: int, department_id: int, start_date: str, e
             end_date = start_date
         
         # Get department hours
-        dept_sql = "SELECT hours FROM departments WHERE id = %s"
-        dept_response = requests.post(
-            f'{API_BASE}/api/query',
-            json={'sql': dept_sql, 'params': [department_id]}
-        )
-        
-        if dept_response.status_code != 200:
-            return {"error": "Failed to get department hours"}
+        hours_str = _get_dept_hours(department_id)
         
-        dept_data = dept_response.json()
-        if not dept_data.get('results'):
+        if hours_str is None:
             return {"error": f"Department {department_id} not found"}
         
-        hours_str = dept_data['results'][0]['hours']
+        # Get booked appointments in date range (one row per date with its booked times)
+        booked = _query(SQL_BOOKED_TIMES, [provider_id, department_id, start_date, end_date], name='booked_times')
         
-        # Get booked appointments in date range
-        apt_sql = """
-            SELECT date, appointment_time
-            FROM appointments
-            WHERE provider_id = %s
-            AND department_id = %s
-            AND date >= %s
-            AND date <= %s
-            AND status = 'scheduled'
-        """
-        
-        apt_response = requests.post(
-            f'{API_BASE}/api/query',
-            json={'sql': apt_sql, 'params': [provider_id, department_id, start_date, end_date]}
-        )
-        
-        if apt_response.status_code != 200:
-            return {"error": "Failed to get booked appointments"}
-        
-        apt_data = apt_response.json()
-        booked = apt_data.get('results', [])
-        
-        # Build dict of booked times by date
-        booked_by_date = {}
-        for apt in booked:
-            date = apt['date']
-            if date not in booked_by_date:
-                booked_by_date[date] = set()
-            booked_by_date[date].add(apt['appointment_time'])
-        
-        # For simplicity, return office hours string and booked times
+        # For simplicity, return office hours string and booked times (lists by date)
         # Agent can reason about what's available
         return {
             "office_hours": hours_str,
             "date_range": f"{start_date} to {end_date}",
-            "booked_times": booked_by_date,
-            "message": f"Office hours: {hours_str}. Booked times provided by date."
+            "booked_times": {row['date']: row['times'] for row in booked}
         }
     
     except Exception as e:
@@ -199,27 +409,7 @@ def check_appointment_history(patient_id: int, provider_id: int) -> dict:
         # Calculate date 5 years ago
         five_years_ago = (datetime.now() - timedelta(days=5*365)).strftime('%Y-%m-%d')
         
-        sql = """
-            SELECT date, status
-            FROM appointments
-            WHERE patient_id = %s
-            AND provider_id = %s
-            AND date >= %s
-            AND status = 'completed'
-            ORDER BY date DESC
-            LIMIT 1
-        """
-        
-        response = requests.post(
-            f'{API_BASE}/api/query',
-            json={'sql': sql, 'params': [patient_id, provider_id, five_years_ago]}
-        )
-        
-        if response.status_code != 200:
-            return {"error": f"Failed to check history: {response.text}"}
-        
-        data = response.json()
-        appointments = data.get('results', [])
+        appointments = _query(SQL_APPOINTMENT_HISTORY, [patient_id, provider_id, five_years_ago], name='appointment_history')
         
         if appointments:
             last_visit = appointments[0]['date']
@@ -239,6 +429,7 @@ def check_appointment_history(patient_id: int, provider_id: int) -> dict:
         return {"error": f"Tool error: {str(e)}"}
 
 
+@_reference_cached(_insurance_cache)
 def check_insurance(insurance_name: str) -> dict:
     """
     Check if insurance is accepted.
@@ -251,18 +442,7 @@ def check_insurance(insurance_name: str) -> dict:
     """
     try:
         # Check if this specific insurance is accepted using ILIKE for case-insensitive match
-        sql = "SELECT id, name, accepted FROM insurances WHERE name ILIKE %s"
-        
-        response = requests.post(
-            f'{API_BASE}/api/query',
-            json={'sql': sql, 'params': [f"%{insurance_name}%"]}
-        )
-        
-        if response.status_code != 200:
-            return {"error": f"Failed to query insurances: {response.text}"}
-        
-        data = response.json()
-        results = data.get('results', [])
+        results = _query(SQL_INSURANCE_BY_NAME, [f"%{insurance_name}%"], name='insurance_by_name')
         
         # Check if we found a match
         if results:
@@ -281,16 +461,7 @@ def check_insurance(insurance_name: str) -> dict:
                 }
         
         # No match found - get list of accepted insurances
-        list_sql = "SELECT name FROM insurances WHERE accepted = TRUE"
-        list_response = requests.post(
-            f'{API_BASE}/api/query',
-            json={'sql': list_sql}
-        )
-        
-        accepted_list = []
-        if list_response.status_code == 200:
-            list_data = list_response.json()
-            accepted_list = [ins['name'] for ins in list_data.get('results', [])]
+        accepted_list = [ins['name'] for ins in _query(SQL_ACCEPTED_INSURANCES, name='accepted_insurances')]
         
         return {
             "accepted": False,
@@ -315,8 +486,8 @@ def set_patient_insurance(patient_id: int, insurance_name: str) -> dict:
         dict with success status and whether insurance is accepted
     """
     try:
-        response = requests.post(
-            f'{API_BASE}/api/set_patient_insurance',
+        response = _get_client().post(
+            '/api/set_patient_insurance',
             json={
                 'patient_id': patient_id,
                 'insurance_name': insurance_name
@@ -327,12 +498,14 @@ def set_patient_insurance(patient_id: int, insurance_name: str) -> dict:
             error_data = response.json()
             return {"error": error_data.get('error', 'Failed to set insurance')}
         
+        _insurance_cache.clear()
         return response.json()
     
     except Exception as e:
         return {"error": f"Tool error: {str(e)}"}
 
 
+@_reference_cached(_self_pay_cache)
 def get_self_pay_rate(specialty: str) -> dict:
     """
     Get self-pay rate for a specialty.
@@ -344,18 +517,7 @@ def get_self_pay_rate(specialty: str) -> dict:
         dict with rate information
     """
     try:
-        sql = "SELECT name, self_pay_rate FROM specialties WHERE name ILIKE %s"
-        
-        response = requests.post(
-            f'{API_BASE}/api/query',
-            json={'sql': sql, 'params': [specialty]}
-        )
-        
-        if response.status_code != 200:
-            return {"error": f"Failed to query rates: {response.text}"}
-        
-        data = response.json()
-        results = data.get('results', [])
+        results = _query(SQL_SELF_PAY_RATE, [specialty], name='self_pay_rate')
         
         if not results:
             return {
@@ -375,6 +537,34 @@ def get_self_pay_rate(specialty: str) -> dict:
         return {"error": f"Tool error: {str(e)}"}
 
 
+def intake_insurance(patient_id: int, insurance_name: str, specialty: Optional[str] = None) -> dict:
+    """
+    Set a patient's insurance and, if it isn't accepted, look up the self-pay rate.
+    Combines set_patient_insurance and get_self_pay_rate into one tool call.
+    
+    Args:
+        patient_id: Patient ID
+        insurance_name: Insurance provider name
+        specialty: Optional specialty to quote a self-pay rate for
+    
+    Returns:
+        dict with acceptance status and self-pay rate (when not accepted)
+    """
+    result = set_patient_insurance(patient_id, insurance_name)
+    if "error" in result:
+        return result
+    
+    if not result.get("accepted") and specialty:
+        rate = get_self_pay_rate(specialty)
+        if rate.get("found"):
+            result["self_pay_rate"] = rate["rate"]
+            result["message"] += f" {rate['message']}."
+        else:
+            result["self_pay_rate"] = None
+    
+    return result
+
+
 def book_appointment(patient_id: int, provider_id: int, department_id: int, 
                     appointment_type: str, date: str, appointment_time: str, 
                     notes: str = "") -> dict:
@@ -404,8 +594,8 @@ def book_appointment(patient_id: int, provider_id: int, department_id: int,
             "notes": notes
         }
         
-        response = requests.post(
-            f'{API_BASE}/api/book',
+        response = _get_client().post(
+            '/api/book',
             json=booking_data
         )
         
@@ -451,20 +641,36 @@ def query_database(sql: str, params: List = None) -> dict:
         if params is None:
             params = []
         
-        response = requests.post(
-            f'{API_BASE}/api/query',
-            json={'sql': sql, 'params': params}
-        )
+        guard_error = _check_query_guard_rails(sql)
+        if guard_error:
+            return {"error": guard_error}
         
-        if response.status_code != 200:
-            return {"error": f"Query failed: {response.text}"}
+        query_error = select_query_error(sql)
+        if query_error:
+            return {"error": f"Query rejected: {query_error}"}
         
-        data = response.json()
+        results = _query(sql, params)
         return {
             "success": True,
-            "results": data.get('results', []),
-            "row_count": data.get('row_count', 0)
+            "results": results,
+            "row_count": len(results)
         }
     
     except Exception as e:
-        return {"error": f"Tool error: {str(e)}"}
\ No newline at end of file
+        return {"error": f"Tool error: {str(e)}"}
+
+
+def _check_query_guard_rails(sql: str) -> Optional[str]:
+    """Return an error message telling the model how to fix a query, or None if it's allowed."""
+    if not sql.strip().upper().startswith('SELECT'):
+        return "Query rejected: only SELECT queries are allowed."
+    
+    if not QUERY_LIMIT_RE.search(sql):
+        return "Query rejected: add a LIMIT clause (e.g. LIMIT 50)."
+    
+    table = HIGH_CARDINALITY_TABLES_RE.search(sql)
+    if table and not QUERY_WHERE_RE.search(sql):
+        return (f"Query rejected: queries on {table.group(1)} need a WHERE clause. "
+                "Filter by id (use WHERE id IN (...) for several) instead of scanning the table.")
+    
+    return None
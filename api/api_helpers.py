@@ -3,37 +3,119 @@ Helper functions for Flask API.
 Date/time formatting, calculations, etc.
 """
 
-from datetime import datetime, timedelta
+import re
+from datetime import date, time
+from functools import lru_cache
+import pglast
 
+# Inputs are always %Y-%m-%d dates and %H:%M times, so they're parsed without strptime
+# (called once per appointment when loading a patient, strptime dominated the loop).
+# Canonical values go through fromisoformat; anything else strptime would accept is
+# matched with strptime's own field patterns for %Y, %m, %d, %H and %M.
+ISO_DATE_RE = re.compile(r'(\d\d\d\d)-(1[0-2]|0[1-9]|[1-9])-(3[01]|[12]\d|0[1-9]|[1-9]| [1-9])')
+TIME_RE = re.compile(r'(2[0-3]|[0-1]\d|\d):([0-5]\d|\d)')
 
-def calculate_arrival_time(appointment_time: str, appointment_type: str) -> str:
+
+def parse_time_24hr(time_24hr: str) -> tuple:
+    """(hour, minute) from HH:MM; raises ValueError like strptime('%H:%M') would."""
+    if len(time_24hr) == 5 and time_24hr[2] == ':':
+        try:
+            parsed = time.fromisoformat(time_24hr)  # C fast path for the canonical form
+            return parsed.hour, parsed.minute
+        except ValueError:
+            pass  # The checks below raise (or accept what strptime would)
+    
+    match = TIME_RE.fullmatch(time_24hr)
+    if not match:
+        raise ValueError(f"time data {time_24hr!r} does not match format '%H:%M'")
+    return int(match[1]), int(match[2])
+
+
+def parse_iso_date(iso_date: str) -> tuple:
+    """(year, month, day) from YYYY-MM-DD; raises ValueError like strptime('%Y-%m-%d') would."""
+    if len(iso_date) == 10 and iso_date[4] == iso_date[7] == '-':
+        try:
+            parsed = date.fromisoformat(iso_date)  # C fast path for the canonical form
+            return parsed.year, parsed.month, parsed.day
+        except ValueError:
+            pass  # The checks below raise (or accept what strptime would)
+    
+    match = ISO_DATE_RE.fullmatch(iso_date)
+    if not match:
+        raise ValueError(f"time data {iso_date!r} does not match format '%Y-%m-%d'")
+    year, month, day = int(match[1]), int(match[2]), int(match[3])
+    date(year, month, day)  # Rejects impossible dates (2024-02-30)
+    return year, month, day
+
+
+def calculate_arrival_time(hour: int, minute: int, is_new: bool) -> str:
     """
-    Calculate arrival time based on appointment type.
+    Calculate arrival time (HH:MM) for an appointment at hour:minute.
     NEW: 30 min early, ESTABLISHED: 10 min early
     """
-    try:
-        time_obj = datetime.strptime(appointment_time, '%H:%M')
-        minutes_early = 30 if appointment_type == 'NEW' else 10
-        arrival = time_obj - timedelta(minutes=minutes_early)
-        return arrival.strftime('%H:%M')
-    except ValueError:
-        # Fallback if time format is wrong
-        return appointment_time
+    minutes_early = 30 if is_new else 10
+    arrival_hour, arrival_minute = divmod((hour * 60 + minute - minutes_early) % (24 * 60), 60)
+    return f"{arrival_hour:02d}:{arrival_minute:02d}"
 
 
-def format_date_for_api(iso_date: str) -> str:
-    """Convert ISO date (2024-08-12) to API format (8/12/24)"""
-    try:
-        date_obj = datetime.strptime(iso_date, '%Y-%m-%d')
-        return date_obj.strftime('%-m/%d/%y')  # %-m removes leading zero
-    except ValueError:
-        return iso_date
+# psycopg2 placeholders (%s, %(name)s) and escaped percent signs, rewritten for Postgres' own parser
+SQL_PARAM_RE = re.compile(r'%(?:\(\w+\))?s|%%')
+
+# Statements that can change data even when nested inside a SELECT (data-modifying CTEs,
+# SELECT ... INTO, row locks)
+WRITE_NODES = {'InsertStmt', 'UpdateStmt', 'DeleteStmt', 'MergeStmt', 'IntoClause', 'LockingClause'}
 
+# Functions with side effects a SELECT can call: sequences, session settings, other backends,
+# server files, session-level locks, large objects, remote SQL, and SQL run from a string
+SIDE_EFFECT_FUNCTIONS = {
+    'nextval', 'setval', 'set_config', 'pg_sleep', 'pg_sleep_for', 'pg_sleep_until', 'pg_notify',
+    'pg_cancel_backend', 'pg_terminate_backend', 'pg_reload_conf', 'pg_rotate_logfile',
+    'pg_read_file', 'pg_read_binary_file', 'pg_ls_dir', 'pg_stat_file', 'pg_switch_wal',
+    'pg_create_restore_point', 'pg_logical_emit_message', 'query_to_xml', 'query_to_xml_and_xmlschema',
+    'query_to_xmlschema', 'cursor_to_xml'
+}
+SIDE_EFFECT_FUNCTION_PREFIXES = ('pg_advisory_', 'pg_try_advisory_', 'lo_', 'dblink', 'pg_stat_reset',
+                                 'pg_replication_', 'pg_create_', 'pg_drop_')
 
-def format_time_for_api(time_24hr: str) -> str:
-    """Convert 24hr time (14:30) to 12hr format (2:30pm)"""
+
+def _nodes(node):
+    """Every node (dict with an '@' tag) in a parse tree serialized by pglast."""
+    if isinstance(node, dict):
+        yield node
+        for value in node.values():
+            yield from _nodes(value)
+    elif isinstance(node, (list, tuple)):
+        for value in node:
+            yield from _nodes(value)
+
+
+def _function_name(node):
+    """Unqualified, lower-case name of a FuncCall node."""
+    return node['funcname'][-1]['sval'].lower()
+
+
+@lru_cache(maxsize=512)
+def select_query_error(sql: str):
+    """
+    None if sql is exactly one SELECT statement with no writes and no calls to
+    SIDE_EFFECT_FUNCTIONS, else the reason it's rejected. Parsed with Postgres' own parser
+    (pglast), so comments, stacked statements and data-modifying CTEs can't slip past.
+    Functions are matched by name, so this is a first line only: the API also runs these
+    queries in read-only transactions. Cached, since tools send the same SQL repeatedly.
+    """
     try:
-        time_obj = datetime.strptime(time_24hr, '%H:%M')
-        return time_obj.strftime('%-I:%M%p').lower()  # 2:30pm
-    except ValueError:
-        return time_24hr
+        statements = pglast.parse_sql(SQL_PARAM_RE.sub(lambda m: '%' if m[0] == '%%' else '$1', sql))
+    except pglast.parser.ParseError as e:
+        return f"Invalid SQL: {e}"
+    
+    if len(statements) != 1 or not isinstance(statements[0].stmt, pglast.ast.SelectStmt):
+        return "Only single SELECT statements are allowed"
+    nodes = list(_nodes(statements[0].stmt(skip_none=True)))
+    if WRITE_NODES.intersection(node.get('@') for node in nodes):
+        return "Only read-only SELECT queries are allowed"
+    for node in nodes:
+        if node.get('@') == 'FuncCall':
+            function = _function_name(node)
+            if function in SIDE_EFFECT_FUNCTIONS or function.startswith(SIDE_EFFECT_FUNCTION_PREFIXES):
+                return f"Function not allowed: {function}"
+    return None
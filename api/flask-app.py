@@ -2,22 +2,68 @@
 # Phase 2: Extended with Supabase integration
 
 import os
-from datetime import datetime
-from flask import Flask, jsonify, request
+import re
+import time
+import atexit
+import uuid
+import threading
+import weakref
+import itertools
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date
+from decimal import Decimal
+from typing import Annotated, Literal, Optional
+from hashlib import blake2b
+import orjson
+from pydantic import AfterValidator, BaseModel, ValidationError
+from flask import Flask, Response, jsonify, request
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from dotenv import load_dotenv
 from supabase import create_client
 import psycopg2
 from psycopg2.extras import RealDictCursor
+from psycopg2.pool import ThreadedConnectionPool
 
 # Import helpers
-from api_helpers import calculate_arrival_time, format_date_for_api, format_time_for_api
+from api_helpers import calculate_arrival_time, parse_iso_date, parse_time_24hr, select_query_error
 
 # Load environment variables
 load_dotenv()
 
+def _orjson_default(obj):
+    """Serialize types orjson doesn't handle natively (NUMERIC columns come back as Decimal)."""
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    jsonify()/request.json backed by orjson: faster on large query results, and
+    date/time/datetime columns serialize as ISO strings (time isn't supported by the default).
+    """
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        """jsonify(): orjson's bytes become the body directly (no decode/re-encode round trip)."""
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
 # Initialize Flask app
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 CORS(app)  # Enable CORS for frontend
 
 # Initialize Supabase client
@@ -31,18 +77,220 @@ if not SUPABASE_URL or not SUPABASE_KEY:
 else:
     supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
 
-# Initialize PostgreSQL connection for raw SQL queries
-POSTGRES_CONNECTION = None
+# Initialize PostgreSQL connection pool for raw SQL queries
+# Each request checks out its own connection, so concurrent tool calls don't queue on one.
+# POSTGRES_POOL_MAX is per process: keep it x API_WORKERS under the database's connection limit.
+POSTGRES_POOL_MAX = int(os.getenv('POSTGRES_POOL_MAX', '25'))
+# putconn closes a returned connection once minconn are idle, so minconn below the max would
+# reconnect on almost every request under load; all POSTGRES_POOL_MAX are opened at startup instead
+POSTGRES_POOL_MIN = POSTGRES_POOL_MAX
+POSTGRES_POOL = None
+# ThreadedConnectionPool raises once maxconn connections are out; requests wait for one instead
+# (a gevent worker can have far more requests in flight than the pool has connections)
+_pool_slots = threading.BoundedSemaphore(POSTGRES_POOL_MAX)
 conn_string = os.getenv('POSTGRES_CONNECTION_STRING')
 
 if conn_string:
     try:
-        POSTGRES_CONNECTION = psycopg2.connect(conn_string)
+        POSTGRES_POOL = ThreadedConnectionPool(POSTGRES_POOL_MIN, POSTGRES_POOL_MAX, conn_string)
+        atexit.register(POSTGRES_POOL.closeall)
         print("✓ Connected to PostgreSQL for raw SQL queries")
     except Exception as e:
         print(f"⚠ PostgreSQL connection failed: {e}")
 
 
+@contextmanager
+def _pg_cursor(name=None, readonly=False):
+    """
+    Cursor on a pooled connection, returned to the pool afterwards with its transaction
+    rolled back (closed connections are discarded, so one dropped connection doesn't break the app).
+    Waits for a free connection when all POSTGRES_POOL_MAX are in use.
+    A name makes it a server-side cursor that fetches rows in batches as they're iterated.
+    readonly runs the transaction as BEGIN READ ONLY, so Postgres rejects any write in it.
+    """
+    with _pool_slots:
+        conn = POSTGRES_POOL.getconn()
+        try:
+            # Set on every checkout: pooled connections are shared with booking writes
+            conn.set_session(readonly=readonly)
+            with conn.cursor(name=name, cursor_factory=RealDictCursor) as cursor:
+                yield cursor
+        finally:
+            if not conn.closed:
+                conn.rollback()
+            POSTGRES_POOL.putconn(conn, close=bool(conn.closed))
+
+
+# With DB_PREPARE_STATEMENTS=1, /api/batch queries are prepared once per pooled connection
+# and run with EXECUTE, so repeated templates skip parsing and planning. Needs a session
+# connection (direct or port 5432): the 6543 transaction pooler doesn't keep prepared statements.
+PREPARE_STATEMENTS = os.getenv('DB_PREPARE_STATEMENTS') == '1'
+PREPARED_MAX = 64  # per connection, least recently used are deallocated
+# {connection: OrderedDict of statement names}; weakly keyed, so an entry goes away with its
+# connection however the pool closes it
+_prepared = weakref.WeakKeyDictionary()
+POSITIONAL_PARAM_RE = re.compile(r'%s|%%')
+
+
+def _execute_prepared(cursor, sql, params):
+    """EXECUTE sql as a prepared statement named after its hash, preparing it on first use."""
+    prepared = _prepared.setdefault(cursor.connection, OrderedDict())
+    name = f"q_{blake2b(sql.encode(), digest_size=8).hexdigest()}"
+    
+    if name in prepared:
+        prepared.move_to_end(name)
+    else:
+        numbered = itertools.count(1)
+        cursor.execute(f"PREPARE {name} AS " + POSITIONAL_PARAM_RE.sub(
+            lambda m: '%' if m[0] == '%%' else f"${next(numbered)}", sql))
+        prepared[name] = True
+        if len(prepared) > PREPARED_MAX:
+            cursor.execute(f"DEALLOCATE {prepared.popitem(last=False)[0]}")
+    
+    cursor.execute(f"EXECUTE {name}({', '.join(['%s'] * len(params))})" if params else f"EXECUTE {name}", params)
+
+
+# Patient payloads by ID, reused while a nurse reconnects or revisits patients.
+# Entries expire after PATIENT_CACHE_TTL seconds (PATIENT_NOT_FOUND_TTL for missing patients)
+# and are dropped on booking/insurance writes. The cache is per process and a write only
+# invalidates the process that handled it, so it's off (0) by default and only safe with a
+# single API worker; gunicorn.conf.py turns it off whenever API_WORKERS > 1.
+PATIENT_CACHE_TTL = int(os.getenv('PATIENT_CACHE_TTL', '0'))
+PATIENT_NOT_FOUND_TTL = 30
+PATIENT_CACHE_MAX = 256
+PATIENT_NOT_FOUND = object()  # Cached in place of a payload for IDs with no patient
+_patient_cache = OrderedDict()  # {patient_id: (time, response_data or PATIENT_NOT_FOUND)}
+_patient_cache_lock = threading.Lock()
+
+# Prefetches of the next patient run on a small pool; one per ID at a time, and skipped when busy
+PREFETCH_MAX_PENDING = 4
+_prefetch_executor = ThreadPoolExecutor(max_workers=2)
+_prefetching = set()  # Patient IDs with a prefetch queued or running
+
+
+def _cached_patient(patient_id):
+    """Cached payload (or PATIENT_NOT_FOUND) for a patient, or None if missing or expired."""
+    with _patient_cache_lock:
+        entry = _patient_cache.get(str(patient_id))
+        if entry:
+            ttl = PATIENT_NOT_FOUND_TTL if entry[1] is PATIENT_NOT_FOUND else PATIENT_CACHE_TTL
+            if time.monotonic() - entry[0] < ttl:
+                return entry[1]
+    return None
+
+
+def _cache_patient(patient_id, response_data):
+    """Store a patient payload (or PATIENT_NOT_FOUND), evicting the oldest entry when full."""
+    if not PATIENT_CACHE_TTL:
+        return
+    with _patient_cache_lock:
+        _patient_cache[str(patient_id)] = (time.monotonic(), response_data)
+        _patient_cache.move_to_end(str(patient_id))
+        while len(_patient_cache) > PATIENT_CACHE_MAX:
+            _patient_cache.popitem(last=False)
+
+
+def _invalidate_patient(patient_id):
+    """Drop a patient's cached payload after a write that changes it."""
+    with _patient_cache_lock:
+        _patient_cache.pop(str(patient_id), None)
+
+
+def _prefetch_patient(patient_id):
+    """Warm the cache for a patient (nurses usually work through IDs in order)."""
+    try:
+        response_data = _load_patient(patient_id)
+        _cache_patient(patient_id, response_data if response_data is not None else PATIENT_NOT_FOUND)
+    except Exception as e:
+        print(f"Error prefetching patient {patient_id}: {str(e)}")
+    finally:
+        with _patient_cache_lock:
+            _prefetching.discard(patient_id)
+
+
+def _schedule_prefetch(patient_id):
+    """Queue a prefetch unless the patient is cached, already being fetched, or the pool is busy."""
+    if not PATIENT_CACHE_TTL or _cached_patient(patient_id) is not None:
+        return
+    with _patient_cache_lock:
+        if patient_id in _prefetching or len(_prefetching) >= PREFETCH_MAX_PENDING:
+            return
+        _prefetching.add(patient_id)
+    _prefetch_executor.submit(_prefetch_patient, patient_id)
+
+
+# Patient with insurance, appointments (newest first) and referrals in one round trip,
+# through the get_patient_bundle function (database/patient_bundle_migration)
+PATIENT_SQL = "SELECT get_patient_bundle(%s) AS patient"
+
+
+def _fetch_patient(patient_id):
+    """
+    Patient row with 'insurances', 'appointments' and 'referrals' embedded; None if not found.
+    One call to get_patient_bundle, over the connection pool when configured, else as a Supabase RPC.
+    """
+    if POSTGRES_POOL:
+        with _pg_cursor() as cursor:
+            cursor.execute(PATIENT_SQL, [int(patient_id)])
+            return cursor.fetchone()['patient']
+    
+    return supabase.rpc('get_patient_bundle', {'pid': int(patient_id)}).execute().data
+
+
+def _load_patient(patient_id):
+    """Build the patient payload from the database; None if the patient doesn't exist."""
+    patient = _fetch_patient(patient_id)
+    
+    if patient is None:
+        return None
+    
+    # Format appointments for API response (date_str/time_str come formatted from appointments_api_v)
+    appointments = []
+    for apt in patient['appointments']:
+        provider_name = f"Dr. {apt['providers']['first_name']} {apt['providers']['last_name']}"
+        appointments.append({
+            "date": apt['date_str'],
+            "time": apt['time_str'],
+            "provider": provider_name,
+            "status": apt['status'],
+            "notes": apt.get('notes', '')
+        })
+    
+    # Format referrals
+    referred_providers = []
+    for ref in patient['referrals']:
+        ref_data = {"specialty": ref['specialties']['name']}
+        if ref.get('providers'):
+            provider = ref['providers']
+            ref_data["provider"] = f"{provider['last_name']}, {provider['first_name']} MD"
+        referred_providers.append(ref_data)
+    
+    # Build response matching original format
+    response_data = {
+        "id": patient['id'],
+        "name": f"{patient['first_name']} {patient['last_name']}",
+        "dob": patient['dob'],
+        "pcp": patient.get('pcp', ''),
+        "ehrId": patient.get('ehr_id', ''),
+        "notes": patient.get('notes', ''),
+        "referred_providers": referred_providers,
+        "appointments": appointments
+    }
+    
+    # Add insurance information if patient has one
+    if patient.get('insurances'):
+        insurance = patient['insurances']
+        response_data["insurance"] = {
+            "id": insurance['id'],
+            "name": insurance['name'],
+            "accepted": insurance['accepted']
+        }
+    else:
+        response_data["insurance"] = None
+    
+    return response_data
+
+
 # ============================================
 # ROUTES
 # ============================================
@@ -57,81 +305,30 @@ def healthcheck():
 def get_patient(patient_id):
     """
     Get patient information with appointments and referrals.
-    Now queries Supabase instead of returning hardcoded data.
+    Now queries the database instead of returning hardcoded data.
     """
-    if not supabase:
+    if not supabase and not POSTGRES_POOL:
         return jsonify({"error": "Database connection not configured"}), 500
     
     try:
-        # Get patient data with insurance
-        patient_response = supabase.table('patients').select('''
-            *,
-            insurances(id, name, accepted)
-        ''').eq('id', patient_id).execute()
-        
-        if not patient_response.data:
+        response_data = _cached_patient(patient_id)
+        if response_data is None:
+            response_data = _load_patient(patient_id)
+            _cache_patient(patient_id, response_data if response_data is not None else PATIENT_NOT_FOUND)
+        if response_data is None or response_data is PATIENT_NOT_FOUND:
             return jsonify({"error": f"Patient {patient_id} not found"}), 404
         
-        patient = patient_response.data[0]
-        
-        # Get appointments with provider names
-        appointments_response = supabase.table('appointments').select('''
-            *,
-            providers(first_name, last_name)
-        ''').eq('patient_id', patient_id).order('date', desc=True).execute()
-        
-        # Format appointments for API response
-        appointments = []
-        for apt in appointments_response.data:
-            provider_name = f"Dr. {apt['providers']['first_name']} {apt['providers']['last_name']}"
-            appointments.append({
-                "date": format_date_for_api(apt['date']),
-                "time": format_time_for_api(apt['appointment_time']),
-                "provider": provider_name,
-                "status": apt['status'],
-                "notes": apt.get('notes', '')
-            })
-        
-        # Get referrals
-        referrals_response = supabase.table('referrals').select('''
-            *,
-            providers(first_name, last_name),
-            specialties(name)
-        ''').eq('patient_id', patient_id).execute()
-        
-        # Format referrals
-        referred_providers = []
-        for ref in referrals_response.data:
-            ref_data = {"specialty": ref['specialties']['name']}
-            if ref.get('providers'):
-                provider = ref['providers']
-                ref_data["provider"] = f"{provider['last_name']}, {provider['first_name']} MD"
-            referred_providers.append(ref_data)
-        
-        # Build response matching original format
-        response_data = {
-            "id": patient['id'],
-            "name": f"{patient['first_name']} {patient['last_name']}",
-            "dob": patient['dob'],
-            "pcp": patient.get('pcp', ''),
-            "ehrId": patient.get('ehr_id', ''),
-            "notes": patient.get('notes', ''),
-            "referred_providers": referred_providers,
-            "appointments": appointments
-        }
-        
-        # Add insurance information if patient has one
-        if patient.get('insurances'):
-            insurance = patient['insurances']
-            response_data["insurance"] = {
-                "id": insurance['id'],
-                "name": insurance['name'],
-                "accepted": insurance['accepted']
-            }
-        else:
-            response_data["insurance"] = None
-        
-        return jsonify(response_data)
+        # Warm the next patient in the background
+        if str(patient_id).isdigit():
+            _schedule_prefetch(int(patient_id) + 1)
+        
+        # ETag from the payload: a re-read of an unchanged patient gets 304 with no body.
+        # private/no-cache: patient data is never stored by shared caches, and browsers revalidate.
+        response = jsonify(response_data)
+        response.add_etag()
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
     
     except Exception as e:
         print(f"Error getting patient data: {str(e)}")
@@ -149,7 +346,7 @@ def query_database():
         "params": [1]
     }
     """
-    if not POSTGRES_CONNECTION:
+    if not POSTGRES_POOL:
         return jsonify({"error": "Database connection not configured"}), 500
     
     try:
@@ -161,27 +358,237 @@ def query_database():
         sql = data['sql']
         params = data.get('params', [])
         
-        # Security: Only allow SELECT queries
-        if not sql.strip().upper().startswith('SELECT'):
-            return jsonify({"error": "Only SELECT queries are allowed"}), 400
+        # Security: Only allow a single read-only SELECT statement
+        error = select_query_error(sql)
+        if error:
+            return jsonify({"error": error}), 400
         
-        # Execute query
-        cursor = POSTGRES_CONNECTION.cursor(cursor_factory=RealDictCursor)
+        # Execute query (the first chunk runs it, so query errors still get a 500 below)
+        chunks = _query_response_chunks(sql, params)
+        first_chunk = next(chunks)
+        
+        return Response(itertools.chain([first_chunk], chunks), mimetype='application/json')
+    
+    except Exception as e:
+        print(f"Query error: {str(e)}")
+        return jsonify({"error": f"Query failed: {str(e)}"}), 500
+
+
+# Rows fetched per round trip while streaming an /api/query response
+QUERY_ITERSIZE = 500
+
+
+def _query_response_chunks(sql, params):
+    """
+    The /api/query response body ({"results": [...], "row_count": n}) as JSON chunks.
+    Rows come from a server-side cursor QUERY_ITERSIZE at a time and are written out as
+    they arrive, so a large result is never held in memory whole.
+    """
+    with _pg_cursor(name=f"query_{uuid.uuid4().hex}", readonly=True) as cursor:
+        cursor.itersize = QUERY_ITERSIZE
         cursor.execute(sql, params)
-        results = cursor.fetchall()
-        cursor.close()
+        yield b'{"results":['
         
-        # Convert to list of dicts
-        results_list = [dict(row) for row in results]
+        row_count = 0
+        for row in cursor:
+            if row_count:
+                yield b','
+            yield orjson.dumps(row, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS)
+            row_count += 1
         
-        return jsonify({
-            "results": results_list,
-            "row_count": len(results_list)
-        })
+        yield f'],"row_count":{row_count}}}'.encode()
+
+
+# /api/batch runs up to BATCH_MAX_QUERIES queries per request, BATCH_WORKERS at a time
+BATCH_MAX_QUERIES = 32
+BATCH_WORKERS = 8
+_batch_executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS)
+
+
+def _run_batch_query(item):
+    """Run one /api/batch query on its own pooled connection; returns its result or error entry."""
+    sql = item.get('sql') if isinstance(item, dict) else None
+    if not sql:
+        return {"error": "Missing 'sql' in query"}
+    error = select_query_error(sql)
+    if error:
+        return {"error": error}
     
+    params = item.get('params', [])
+    try:
+        with _pg_cursor(readonly=True) as cursor:
+            # Named (%(name)s) parameters aren't prepared
+            if PREPARE_STATEMENTS and isinstance(params, list) and '%(' not in sql:
+                _execute_prepared(cursor, sql, params)
+            else:
+                cursor.execute(sql, params)
+            results_list = cursor.fetchall()
+        return {"results": results_list, "row_count": len(results_list)}
     except Exception as e:
         print(f"Query error: {str(e)}")
-        return jsonify({"error": f"Query failed: {str(e)}"}), 500
+        return {"error": f"Query failed: {str(e)}"}
+
+
+@app.route('/api/batch', methods=['POST'])
+def query_batch():
+    """
+    Execute several SELECT queries in one request, in parallel on the connection pool.
+    Results come back in request order, each shaped like an /api/query response.
+    
+    Example request body:
+    {
+        "queries": [
+            {"sql": "SELECT * FROM providers WHERE specialty_id = %s", "params": [1]},
+            {"sql": "SELECT hours FROM departments WHERE id = %s", "params": [2]}
+        ]
+    }
+    """
+    if not POSTGRES_POOL:
+        return jsonify({"error": "Database connection not configured"}), 500
+    
+    data = request.json
+    queries = data.get('queries') if isinstance(data, dict) else None
+    
+    if not isinstance(queries, list):
+        return jsonify({"error": "Missing 'queries' list in request body"}), 400
+    if len(queries) > BATCH_MAX_QUERIES:
+        return jsonify({"error": f"At most {BATCH_MAX_QUERIES} queries per batch"}), 400
+    
+    return jsonify({"results": list(_batch_executor.map(_run_batch_query, queries))})
+
+
+def _confirmation_names(patient_id, provider_id, department_id):
+    """
+    Look up the names shown in a booking confirmation with three Supabase requests, sent
+    concurrently (only for supabase-py clients that can't embed them in the insert response).
+    """
+    provider, department, patient = _batch_executor.map(lambda query: query.execute(), [
+        supabase.table('providers').select('first_name, last_name').eq('id', provider_id),
+        supabase.table('departments').select('name').eq('id', department_id),
+        supabase.table('patients').select('first_name, last_name').eq('id', patient_id)
+    ])
+    return {
+        'pf': patient.data[0]['first_name'], 'pl': patient.data[0]['last_name'],
+        'prf': provider.data[0]['first_name'], 'prl': provider.data[0]['last_name'],
+        'dname': department.data[0]['name']
+    }
+
+
+# Returned by _insert_appointment when the slot is already booked
+SLOT_TAKEN = object()
+
+# Insert and the names for the confirmation in one round trip. No row back means the
+# unique slot index (database/unique_booking_migration) rejected the insert.
+BOOK_APPOINTMENT_SQL = """
+    WITH inserted AS (
+        INSERT INTO appointments (patient_id, provider_id, department_id, appointment_type,
+                                  date, appointment_time, arrival_time, status, notes)
+        VALUES (%(patient_id)s, %(provider_id)s, %(department_id)s, %(appointment_type)s,
+                %(date)s, %(appointment_time)s, %(arrival_time)s, %(status)s, %(notes)s)
+        ON CONFLICT DO NOTHING
+        RETURNING id, patient_id, provider_id, department_id
+    )
+    SELECT inserted.id,
+           p.first_name AS pf, p.last_name AS pl,
+           pr.first_name AS prf, pr.last_name AS prl,
+           d.name AS dname
+    FROM inserted
+    JOIN patients p ON p.id = inserted.patient_id
+    JOIN providers pr ON pr.id = inserted.provider_id
+    JOIN departments d ON d.id = inserted.department_id
+"""
+
+# Names embedded in the Supabase insert response (same round trip as the insert)
+BOOKED_NAMES_SELECT = 'id, patients(first_name, last_name), providers(first_name, last_name), departments(name)'
+
+
+def _insert_appointment(appointment_data):
+    """
+    Insert an appointment and return its id with the confirmation names
+    ({'id', 'pf', 'pl', 'prf', 'prl', 'dname'}), or None if the insert failed.
+    Returns SLOT_TAKEN when the provider already has a scheduled appointment at that
+    department, date and time (unique index from database/unique_booking_migration).
+    """
+    if POSTGRES_POOL:
+        # One round trip: the unique index decides, no check-then-insert race
+        with _pg_cursor() as cursor:
+            cursor.execute(BOOK_APPOINTMENT_SQL, appointment_data)
+            row = cursor.fetchone()
+            cursor.connection.commit()
+        return row or SLOT_TAKEN
+    
+    query = supabase.table('appointments').insert(appointment_data)
+    embeds_names = hasattr(query, 'select')  # Older supabase-py clients can't select after insert
+    if embeds_names:
+        query = query.select(BOOKED_NAMES_SELECT)
+    
+    try:
+        result = query.execute()
+    except Exception as e:
+        if getattr(e, 'code', None) == '23505':  # unique_violation
+            return SLOT_TAKEN
+        raise
+    
+    if not result.data:
+        return None
+    row = result.data[0]
+    if not embeds_names:
+        return {'id': row['id'], **_confirmation_names(
+            appointment_data['patient_id'], appointment_data['provider_id'], appointment_data['department_id'])}
+    return {
+        'id': row['id'],
+        'pf': row['patients']['first_name'], 'pl': row['patients']['last_name'],
+        'prf': row['providers']['first_name'], 'prl': row['providers']['last_name'],
+        'dname': row['departments']['name']
+    }
+
+
+def _check_date(value):
+    """Pydantic validator: value must be YYYY-MM-DD (raises ValueError otherwise); returns it zero-padded."""
+    return date(*parse_iso_date(value)).isoformat()
+
+
+def _check_time(value):
+    """Pydantic validator: value must be HH:MM, 24-hour (raises ValueError otherwise); returns it zero-padded."""
+    hour, minute = parse_time_24hr(value)
+    return f"{hour:02d}:{minute:02d}"
+
+
+class BookingRequest(BaseModel):
+    """/api/book request body. Dates and times are text, zero-padded (YYYY-MM-DD, HH:MM) as they're stored."""
+    patient_id: int
+    provider_id: int
+    department_id: int
+    appointment_type: Literal['NEW', 'ESTABLISHED']
+    date: Annotated[str, AfterValidator(_check_date)]
+    appointment_time: Annotated[str, AfterValidator(_check_time)]
+    notes: Optional[str] = ''
+    
+    @property
+    def arrival_time(self):
+        """HH:MM the patient should arrive (NEW 30 min early, ESTABLISHED 10)."""
+        hour, minute = parse_time_24hr(self.appointment_time)
+        return calculate_arrival_time(hour, minute, self.appointment_type == 'NEW')
+
+
+# /api/book error messages by field (anything else gets pydantic's message)
+BOOKING_FIELD_ERRORS = {
+    'appointment_type': "appointment_type must be 'NEW' or 'ESTABLISHED'",
+    'date': "date must be in YYYY-MM-DD format",
+    'appointment_time': "appointment_time must be in HH:MM format (24-hour)"
+}
+
+
+def _booking_error(error):
+    """One error message for a BookingRequest ValidationError (missing fields reported first)."""
+    errors = error.errors()
+    first = next((e for e in errors if e['type'] == 'missing'), errors[0])
+    if not first['loc']:
+        return "Request body must be a JSON object"
+    field = first['loc'][0]
+    if first['type'] == 'missing':
+        return f"Missing required field: {field}"
+    return BOOKING_FIELD_ERRORS.get(field, f"{field}: {first['msg']}")
 
 
 @app.route('/api/book', methods=['POST'])
@@ -200,77 +607,46 @@ def book_appointment():
         "notes": "Follow-up for knee pain"
     }
     """
-    if not supabase:
+    if not supabase and not POSTGRES_POOL:
         return jsonify({"error": "Database connection not configured"}), 500
     
     try:
-        data = request.json
-        
-        # Validate required fields
-        required_fields = ['patient_id', 'provider_id', 'department_id', 
-                          'appointment_type', 'date', 'appointment_time']
-        
-        for field in required_fields:
-            if field not in data:
-                return jsonify({"error": f"Missing required field: {field}"}), 400
-        
-        # Validate appointment type
-        if data['appointment_type'] not in ['NEW', 'ESTABLISHED']:
-            return jsonify({"error": "appointment_type must be 'NEW' or 'ESTABLISHED'"}), 400
-        
-        # Validate date format (YYYY-MM-DD)
-        try:
-            datetime.strptime(data['date'], '%Y-%m-%d')
-        except ValueError:
-            return jsonify({"error": "date must be in YYYY-MM-DD format"}), 400
-        
-        # Validate time format (HH:MM)
+        # Validate request body
         try:
-            datetime.strptime(data['appointment_time'], '%H:%M')
-        except ValueError:
-            return jsonify({"error": "appointment_time must be in HH:MM format (24-hour)"}), 400
+            booking = BookingRequest.model_validate(request.json)
+        except ValidationError as e:
+            return jsonify({"error": _booking_error(e)}), 400
         
-        # Calculate arrival time
-        arrival_time = calculate_arrival_time(
-            data['appointment_time'], 
-            data['appointment_type']
-        )
-        
-        # Insert appointment
+        arrival_time = booking.arrival_time
         appointment_data = {
-            'patient_id': data['patient_id'],
-            'provider_id': data['provider_id'],
-            'department_id': data['department_id'],
-            'appointment_type': data['appointment_type'],
-            'date': data['date'],
-            'appointment_time': data['appointment_time'],
+            **booking.model_dump(),
             'arrival_time': arrival_time,
-            'status': 'scheduled',
-            'notes': data.get('notes', '')
+            'status': 'scheduled'
         }
         
-        result = supabase.table('appointments').insert(appointment_data).execute()
+        # Insert appointment (patient, provider and department names for the
+        # confirmation come back in the same round trip)
+        booked = _insert_appointment(appointment_data)
         
-        if result.data:
-            appointment_id = result.data[0]['id']
-            
-            # Get provider and department names for confirmation
-            provider = supabase.table('providers').select('first_name, last_name').eq('id', data['provider_id']).execute()
-            department = supabase.table('departments').select('name').eq('id', data['department_id']).execute()
-            patient = supabase.table('patients').select('first_name, last_name').eq('id', data['patient_id']).execute()
+        if booked is SLOT_TAKEN:
+            return jsonify({"error": "Slot already booked"}), 409
+        
+        if booked:
+            _invalidate_patient(booking.patient_id)
+            names = booked
             
             return jsonify({
                 "success": True,
-                "appointment_id": appointment_id,
+                "appointment_id": booked['id'],
                 "confirmation": "Appointment booked successfully",
                 "details": {
-                    "patient": f"{patient.data[0]['first_name']} {patient.data[0]['last_name']}",
-                    "provider": f"Dr. {provider.data[0]['first_name']} {provider.data[0]['last_name']}",
-                    "location": department.data[0]['name'],
-                    "date": data['date'],
-                    "appointment_time": data['appointment_time'],
+                    "patient": f"{names['pf']} {names['pl']}",
+                    "provider": f"Dr. {names['prf']} {names['prl']}",
+                    "location": names['dname'],
+                    "date": booking.date,
+                    "appointment_time": booking.appointment_time,
                     "arrival_time": arrival_time,
-                    "type": data['appointment_type']
+                    "type": booking.appointment_type
                 }
             })
         else:
@@ -281,6 +657,47 @@ def book_appointment():
         return jsonify({"error": f"Booking failed: {str(e)}"}), 500
 
 
+# Insurance records by lowercased name. The table is small, so it's loaded whole and
+# reloaded every INSURANCE_CACHE_TTL seconds to pick up changes made outside the API.
+INSURANCE_CACHE_TTL = 60
+_insurance_cache = {}  # {name.lower(): (id, name, accepted)}
+_insurance_cache_loaded_at = None
+_insurance_cache_lock = threading.Lock()
+
+
+def _lookup_insurance(insurance_name):
+    """
+    (id, name, accepted) for an insurance matched case-insensitively, or None.
+    Names missing from the cache are checked in the database before the caller creates them.
+    """
+    global _insurance_cache, _insurance_cache_loaded_at
+    with _insurance_cache_lock:
+        if _insurance_cache_loaded_at is None or time.monotonic() - _insurance_cache_loaded_at > INSURANCE_CACHE_TTL:
+            rows = supabase.table('insurances').select('id, name, accepted').execute().data
+            _insurance_cache = {row['name'].lower(): (row['id'], row['name'], row['accepted']) for row in rows}
+            _insurance_cache_loaded_at = time.monotonic()
+        
+        cached = _insurance_cache.get(insurance_name.lower())
+    if cached:
+        return cached
+    
+    # Possibly added since the last load
+    existing = supabase.table('insurances') \
+        .select('id, name, accepted') \
+        .ilike('name', insurance_name) \
+        .execute()
+    if not existing.data:
+        return None
+    row = existing.data[0]
+    _cache_insurance(row['id'], row['name'], row['accepted'])
+    return row['id'], row['name'], row['accepted']
+
+
+def _cache_insurance(insurance_id, name, accepted):
+    with _insurance_cache_lock:
+        _insurance_cache[name.lower()] = (insurance_id, name, accepted)
+
+
 @app.route('/api/set_patient_insurance', methods=['POST'])
 def set_patient_insurance():
     """
@@ -310,20 +727,15 @@ def set_patient_insurance():
             return jsonify({"error": "insurance_name cannot be empty"}), 400
         
         # Check if insurance exists
-        existing = supabase.table('insurances') \
-            .select('id, name, accepted') \
-            .ilike('name', insurance_name) \
-            .execute()
+        existing = _lookup_insurance(insurance_name)
         
         insurance_id = None
         is_accepted = False
         actual_name = insurance_name
         
-        if existing.data:
+        if existing:
             # Insurance exists - use it
-            insurance_id = existing.data[0]['id']
-            is_accepted = existing.data[0]['accepted']
-            actual_name = existing.data[0]['name']
+            insurance_id, actual_name, is_accepted = existing
         else:
             # Insurance doesn't exist - create it (not accepted by default)
             insert_result = supabase.table('insurances') \
@@ -335,6 +747,7 @@ def set_patient_insurance():
             
             insurance_id = insert_result.data[0]['id']
             is_accepted = False
+            _cache_insurance(insurance_id, insurance_name, False)
         
         # Update patient's insurance_id
         update_result = supabase.table('patients') \
@@ -345,6 +758,8 @@ def set_patient_insurance():
         if not update_result.data:
             return jsonify({"error": "Failed to update patient insurance"}), 500
         
+        _invalidate_patient(patient_id)
+        
         # Build response
         response = {
             "success": True,
@@ -373,5 +788,9 @@ if __name__ == '__main__':
     else:
         print("⚠ Supabase connection not configured - check .env file")
     
+    # Debugger and reloader only in development: the reloader runs the app in a second
+    # process (double the memory) and debug mode adds per-request overhead
+    debug_mode = os.getenv("FLASK_ENV") == "development" or os.getenv("FLASK_DEBUG") == "1"
+    
     print("Starting Flask server on http://localhost:5002")
-    app.run(debug=True, port=5002)
\ No newline at end of file
+    app.run(debug=debug_mode, use_reloader=debug_mode, port=5002)
\ No newline at end of file
@@ -0,0 +1,18 @@
+"""
+gunicorn settings for the Flask API (see wsgi.py).
+gevent workers serve many requests at once per process, so the agent's concurrent
+tool calls run in parallel instead of queuing behind the dev server.
+Each worker opens its own PostgreSQL pool of POSTGRES_POOL_MAX connections.
+"""
+
+import os
+
+bind = os.getenv("API_BIND", "127.0.0.1:5002")
+worker_class = "gevent"
+workers = int(os.getenv("API_WORKERS", "4"))
+worker_connections = 256
+
+# flask-app.py's patient cache is per process: a write in one worker would leave the others
+# serving the old payload, so it's only allowed with a single worker
+if workers > 1:
+    os.environ["PATIENT_CACHE_TTL"] = "0"
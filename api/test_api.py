@@ -6,54 +6,58 @@ Usage:
     python test_api.py
 """
 
-import requests
-import json
+import asyncio
+import importlib.util
+import httpx
 
 BASE_URL = "http://localhost:5000"
 
-def print_test_header(test_name):
-    """Print formatted test header"""
-    print("\n" + "="*60)
-    print(f"TEST: {test_name}")
-    print("="*60)
+# Tests run concurrently, so each one collects its output in a log (a list of lines)
+# that run_tests() prints in order once they've all finished
+
+def print_test_header(log, test_name):
+    """Add formatted test header"""
+    log.append("\n" + "="*60)
+    log.append(f"TEST: {test_name}")
+    log.append("="*60)
 
-def print_success(message):
-    """Print success message"""
-    print(f"✓ {message}")
+def print_success(log, message):
+    """Add success message"""
+    log.append(f"✓ {message}")
 
-def print_error(message):
-    """Print error message"""
-    print(f"✗ {message}")
+def print_error(log, message):
+    """Add error message"""
+    log.append(f"✗ {message}")
 
-def test_healthcheck():
+async def test_healthcheck(client, log):
     """Test 1: Health check endpoint"""
-    print_test_header("Health Check (GET /)")
+    print_test_header(log, "Health Check (GET /)")
     
     try:
-        response = requests.get(f"{BASE_URL}/")
+        response = await client.get("/")
         
         if response.status_code == 200:
-            print_success("Server is running")
-            print(f"Response: {response.json()}")
+            print_success(log, "Server is running")
+            log.append(f"Response: {response.json()}")
             return True
         else:
-            print_error(f"Unexpected status code: {response.status_code}")
+            print_error(log, f"Unexpected status code: {response.status_code}")
             return False
-    except requests.ConnectionError:
-        print_error("Could not connect to server. Is it running?")
-        print("Run: python flask-app.py")
+    except httpx.ConnectError:
+        print_error(log, "Could not connect to server. Is it running?")
+        log.append("Run: python flask-app.py")
         return False
     except Exception as e:
-        print_error(f"Error: {str(e)}")
+        print_error(log, f"Error: {str(e)}")
         return False
 
 
-def test_get_patient():
+async def test_get_patient(client, log):
     """Test 2: Get patient data"""
-    print_test_header("Get Patient (GET /patient/1)")
+    print_test_header(log, "Get Patient (GET /patient/1)")
     
     try:
-        response = requests.get(f"{BASE_URL}/patient/1")
+        response = await client.get("/patient/1")
         
         if response.status_code == 200:
             data = response.json()
@@ -63,26 +67,26 @@ def test_get_patient():
             missing_fields = [field for field in required_fields if field not in data]
             
             if missing_fields:
-                print_error(f"Missing fields: {missing_fields}")
+                print_error(log, f"Missing fields: {missing_fields}")
                 return False
             
-            print_success("Patient data retrieved")
-            print(f"Patient: {data['name']}")
-            print(f"Appointments: {len(data['appointments'])}")
-            print(f"Referrals: {len(data['referred_providers'])}")
+            print_success(log, "Patient data retrieved")
+            log.append(f"Patient: {data['name']}")
+            log.append(f"Appointments: {len(data['appointments'])}")
+            log.append(f"Referrals: {len(data['referred_providers'])}")
             return True
         else:
-            print_error(f"Status code: {response.status_code}")
-            print(f"Response: {response.text}")
+            print_error(log, f"Status code: {response.status_code}")
+            log.append(f"Response: {response.text}")
             return False
     except Exception as e:
-        print_error(f"Error: {str(e)}")
+        print_error(log, f"Error: {str(e)}")
         return False
 
 
-def test_query_database():
+async def test_query_database(client, log):
     """Test 3: Execute SQL query"""
-    print_test_header("Query Database (POST /api/query)")
+    print_test_header(log, "Query Database (POST /api/query)")
     
     try:
         # Test query: Get all specialties
@@ -90,39 +94,35 @@ def test_query_database():
             "sql": "SELECT * FROM specialties"
         }
         
-        response = requests.post(
-            f"{BASE_URL}/api/query",
-            headers={"Content-Type": "application/json"},
-            json=payload
-        )
+        response = await client.post("/api/query", json=payload)
         
         if response.status_code == 200:
             data = response.json()
             
             if 'results' not in data or 'row_count' not in data:
-                print_error("Response missing 'results' or 'row_count'")
+                print_error(log, "Response missing 'results' or 'row_count'")
                 return False
             
-            print_success("Query executed successfully")
-            print(f"Rows returned: {data['row_count']}")
+            print_success(log, "Query executed successfully")
+            log.append(f"Rows returned: {data['row_count']}")
             
             # Show first result
             if data['results']:
-                print(f"Sample result: {data['results'][0]}")
+                log.append(f"Sample result: {data['results'][0]}")
             
             return True
         else:
-            print_error(f"Status code: {response.status_code}")
-            print(f"Response: {response.text}")
+            print_error(log, f"Status code: {response.status_code}")
+            log.append(f"Response: {response.text}")
             return False
     except Exception as e:
-        print_error(f"Error: {str(e)}")
+        print_error(log, f"Error: {str(e)}")
         return False
 
 
-def test_book_appointment():
+async def test_book_appointment(client, log):
     """Test 4: Book an appointment"""
-    print_test_header("Book Appointment (POST /api/book)")
+    print_test_header(log, "Book Appointment (POST /api/book)")
     
     try:
         # Test booking
@@ -136,41 +136,113 @@ def test_book_appointment():
             "notes": "Test appointment from API test script"
         }
         
-        response = requests.post(
-            f"{BASE_URL}/api/book",
-            headers={"Content-Type": "application/json"},
-            json=payload
-        )
+        response = await client.post("/api/book", json=payload)
+        
+        # The slot is fixed, so on a rerun it is already taken from the previous run
+        if response.status_code == 409:
+            print_success(log, "Slot already booked - double booking rejected (409)")
+            return True
         
         if response.status_code == 200:
             data = response.json()
             
             if not data.get('success'):
-                print_error("Booking failed")
-                print(f"Response: {data}")
+                print_error(log, "Booking failed")
+                log.append(f"Response: {data}")
                 return False
             
-            print_success("Appointment booked successfully")
-            print(f"Appointment ID: {data['appointment_id']}")
+            print_success(log, "Appointment booked successfully")
+            log.append(f"Appointment ID: {data['appointment_id']}")
             
             if 'details' in data:
                 details = data['details']
-                print(f"Patient: {details.get('patient')}")
-                print(f"Provider: {details.get('provider')}")
-                print(f"Location: {details.get('location')}")
-                print(f"Date: {details.get('date')} at {details.get('appointment_time')}")
-                print(f"Arrival time: {details.get('arrival_time')}")
+                log.append(f"Patient: {details.get('patient')}")
+                log.append(f"Provider: {details.get('provider')}")
+                log.append(f"Location: {details.get('location')}")
+                log.append(f"Date: {details.get('date')} at {details.get('appointment_time')}")
+                log.append(f"Arrival time: {details.get('arrival_time')}")
             
+            # Booking the same slot again must be rejected
+            retry = await client.post("/api/book", json=payload)
+            if retry.status_code != 409:
+                print_error(log, f"Rebooking the same slot returned {retry.status_code}, expected 409")
+                log.append(f"Response: {retry.text}")
+                return False
+            
+            print_success(log, "Rebooking the same slot rejected (409)")
             return True
         else:
-            print_error(f"Status code: {response.status_code}")
-            print(f"Response: {response.text}")
+            print_error(log, f"Status code: {response.status_code}")
+            log.append(f"Response: {response.text}")
             return False
     except Exception as e:
-        print_error(f"Error: {str(e)}")
+        print_error(log, f"Error: {str(e)}")
         return False
 
 
+async def test_book_unpadded_slot(client, log):
+    """Test 5: Unpadded dates/times are stored zero-padded, so they can't double-book a slot"""
+    print_test_header(log, "Book Unpadded Date/Time (POST /api/book)")
+    
+    try:
+        payload = {
+            "patient_id": 1,
+            "provider_id": 2,
+            "department_id": 2,
+            "appointment_type": "ESTABLISHED",
+            "date": "2026-2-3",
+            "appointment_time": "9:5",
+            "notes": "Test appointment from API test script"
+        }
+        
+        response = await client.post("/api/book", json=payload)
+        
+        # 409 on a rerun, when the previous run already booked this slot
+        if response.status_code == 200:
+            details = response.json().get('details', {})
+            if (details.get('date'), details.get('appointment_time')) != ("2026-02-03", "09:05"):
+                print_error(log, f"Stored as {details.get('date')} {details.get('appointment_time')}, expected 2026-02-03 09:05")
+                return False
+            print_success(log, "2026-2-3 9:5 booked as 2026-02-03 09:05")
+        elif response.status_code != 409:
+            print_error(log, f"Status code: {response.status_code}")
+            log.append(f"Response: {response.text}")
+            return False
+        
+        # The same slot, spelled zero-padded, must be taken
+        retry = await client.post("/api/book", json={**payload, "date": "2026-02-03", "appointment_time": "09:05"})
+        if retry.status_code != 409:
+            print_error(log, f"Rebooking as 2026-02-03 09:05 returned {retry.status_code}, expected 409")
+            log.append(f"Response: {retry.text}")
+            return False
+        
+        print_success(log, "Rebooking the same slot zero-padded rejected (409)")
+        return True
+    except Exception as e:
+        print_error(log, f"Error: {str(e)}")
+        return False
+
+
+async def run_tests():
+    """Run the endpoint tests concurrently over one keep-alive client; returns {test name: passed}"""
+    tests = {
+        "Health Check": test_healthcheck,
+        "Get Patient": test_get_patient,
+        "Query Database": test_query_database,
+        "Book Appointment": test_book_appointment,
+        "Book Unpadded Date/Time": test_book_unpadded_slot
+    }
+    logs = {test_name: [] for test_name in tests}
+    
+    async with httpx.AsyncClient(base_url=BASE_URL, http2=importlib.util.find_spec("h2") is not None) as client:
+        passed = await asyncio.gather(*(test(client, logs[test_name]) for test_name, test in tests.items()))
+    
+    for log in logs.values():
+        print("\n".join(log))
+    
+    return dict(zip(tests, passed))
+
+
 def main():
     """Run all tests"""
     print("\n" + "="*60)
@@ -179,12 +251,7 @@ def main():
     print("\nMake sure flask-app.py is running before running tests!")
     print("(In another terminal: python flask-app.py)\n")
     
-    results = {
-        "Health Check": test_healthcheck(),
-        "Get Patient": test_get_patient(),
-        "Query Database": test_query_database(),
-        "Book Appointment": test_book_appointment()
-    }
+    results = asyncio.run(run_tests())
     
     # Summary
     print("\n" + "="*60)
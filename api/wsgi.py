@@ -0,0 +1,31 @@
+"""
+WSGI entry point for running the Flask API under gunicorn.
+flask-app.py isn't an importable module name, so it's loaded from its path here.
+
+Usage:
+    cd api
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+
+import os
+import sys
+import importlib.util
+
+API_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, API_DIR)  # flask-app.py imports api_helpers
+
+# Under gevent workers, make psycopg2 yield to other greenlets while waiting on the
+# database (must happen before flask-app.py opens its connection pool)
+try:
+    from gevent import monkey
+    if monkey.is_module_patched("socket"):
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+except ImportError:  # gevent/psycogreen are only needed for gevent workers
+    pass
+
+_spec = importlib.util.spec_from_file_location("flask_app", os.path.join(API_DIR, "flask-app.py"))
+flask_app = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(flask_app)
+
+app = flask_app.app
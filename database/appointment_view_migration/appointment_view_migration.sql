@@ -0,0 +1,18 @@
+-- Appointment View Migration
+-- Formats appointment dates and times for the /patient response in the database,
+-- so the API copies strings instead of parsing and reformatting every row.
+
+-- date_str: 2024-08-12 -> 8/12/24, time_str: 14:30 -> 2:30pm (same output as the API's
+-- format_date_for_api / format_time_for_api). Values not in YYYY-MM-DD / HH:MM form are
+-- passed through unchanged, like the API helpers did.
+CREATE OR REPLACE VIEW appointments_api_v AS
+SELECT a.*,
+    CASE WHEN a.date ~ '^\d{4}-(0[1-9]|1[0-2])-(0[1-9]|[12]\d|3[01])$'
+         THEN to_char(a.date::date, 'FMMM/DD/YY')
+         ELSE a.date END AS date_str,
+    CASE WHEN a.appointment_time ~ '^([01]\d|2[0-3]):[0-5]\d$'
+         THEN to_char(DATE '2000-01-01' + a.appointment_time::time, 'FMHH12:MIam')
+         ELSE a.appointment_time END AS time_str
+FROM appointments a;
+
+COMMENT ON VIEW appointments_api_v IS 'Appointments with dates and times pre-formatted for the /patient API response';
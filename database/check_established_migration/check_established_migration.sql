@@ -0,0 +1,19 @@
+-- Check Established Migration
+-- Answers "has this patient seen this provider?" in one call, so test_db.py's
+-- NEW vs ESTABLISHED check needs one round trip instead of three (patient id, provider id, history).
+
+-- Completed visits of the patient (by first/last name) with the provider (by last name):
+-- whether there are any, how many, and the most recent date (YYYY-MM-DD, NULL if none)
+CREATE OR REPLACE FUNCTION check_established(p_first TEXT, p_last TEXT, d_last TEXT)
+RETURNS TABLE (has_history BOOLEAN, count BIGINT, last_date TEXT) AS $$
+    SELECT COUNT(*) > 0, COUNT(*), MAX(a.date)
+    FROM appointments a
+    JOIN patients p ON p.id = a.patient_id
+    JOIN providers pr ON pr.id = a.provider_id
+    WHERE p.first_name = p_first
+      AND p.last_name = p_last
+      AND pr.last_name = d_last
+      AND a.status = 'completed';
+$$ LANGUAGE sql STABLE;
+
+COMMENT ON FUNCTION check_established(TEXT, TEXT, TEXT) IS 'Completed visit count and latest date for a patient/provider pair (used by test_db.py)';
@@ -5,6 +5,19 @@ Parse data_sheet.txt and extract structured data for database seeding.
 import re
 from typing import Dict, List, Tuple
 
+# A provider entry ("- Last, First" line), its certification/specialty lines, and everything
+# up to the next provider (the department blocks)
+PROVIDER_RE = re.compile(
+    r'\n- (?P<last>[A-Za-z]+), (?P<first>[A-Za-z]+)\n'
+    r'(?:[ \t]*- certification:[ \t]*(?P<certification>[^\n]*)\n)?'
+    r'(?:[ \t]*- specialty:[ \t]*(?P<specialty>[^\n]*)\n)?'
+    r'(?P<details>.*?)(?=\n- [A-Za-z]+, [A-Za-z]+\n|\Z)',
+    re.S
+)
+DEPARTMENT_RE = re.compile(r'department:\s*\n\s*- name:\s*(.+)\n\s*- phone:\s*(.+)\n\s*- address:\s*(.+)\n\s*- hours:\s*(.+)')
+RATE_RE = re.compile(r'-\s*([^:]+):\s*\$(\d+)')
+LIST_ITEM_RE = re.compile(r'-\s*(.+)')
+
 
 def parse_data_sheet(filepath: str = '../data_sheet.txt') -> Dict:
     """
@@ -67,39 +80,19 @@ def parse_providers(provider_text: str) -> Tuple[List[Dict], List[Dict], List[Tu
     dept_id_counter = 1
     dept_name_to_id = {}
     
-    # Split by provider (lines starting with "- " followed by name)
-    provider_blocks = re.split(r'\n- ([A-Za-z]+, [A-Za-z]+)\n', provider_text)
-    
-    # Skip first empty element
-    for i in range(1, len(provider_blocks), 2):
-        if i + 1 >= len(provider_blocks):
-            break
-            
-        name = provider_blocks[i]
-        details = provider_blocks[i + 1]
-        
-        # Parse name (format: "Last, First")
-        last_name, first_name = [n.strip() for n in name.split(',')]
-        
-        # Parse certification
-        cert_match = re.search(r'certification:\s*(.+)', details)
-        certification = cert_match.group(1).strip() if cert_match else ""
-        
-        # Parse specialty
-        spec_match = re.search(r'specialty:\s*(.+)', details)
-        specialty = spec_match.group(1).strip() if spec_match else ""
-        
+    # One pass over the directory: each match is a provider with its fields and department lines
+    for match in PROVIDER_RE.finditer(provider_text):
         provider = {
-            'first_name': first_name,
-            'last_name': last_name,
-            'certification': certification,
-            'specialty': specialty
+            'first_name': match['first'],
+            'last_name': match['last'],
+            'certification': (match['certification'] or "").strip(),
+            'specialty': (match['specialty'] or "").strip()
         }
         providers.append(provider)
         provider_id = len(providers)  # 1-indexed
         
         # Parse departments for this provider
-        dept_blocks = re.findall(r'department:\s*\n\s*- name:\s*(.+)\n\s*- phone:\s*(.+)\n\s*- address:\s*(.+)\n\s*- hours:\s*(.+)', details)
+        dept_blocks = DEPARTMENT_RE.findall(match['details'])
         
         for dept_name, phone, address, hours in dept_blocks:
             dept_name = dept_name.strip()
@@ -107,8 +100,9 @@ def parse_providers(provider_text: str) -> Tuple[List[Dict], List[Dict], List[Tu
             address = address.strip()
             hours = hours.strip()
             
-            # Check if department already exists
-            if dept_name not in dept_name_to_id:
+            # Reuse the department if it was already seen (one dict lookup either way)
+            dept_id = dept_name_to_id.get(dept_name)
+            if dept_id is None:
                 department = {
                     'name': dept_name,
                     'phone': phone,
@@ -116,11 +110,8 @@ def parse_providers(provider_text: str) -> Tuple[List[Dict], List[Dict], List[Tu
                     'hours': hours
                 }
                 departments.append(department)
-                dept_name_to_id[dept_name] = dept_id_counter
-                dept_id = dept_id_counter
+                dept_id = dept_name_to_id[dept_name] = dept_id_counter
                 dept_id_counter += 1
-            else:
-                dept_id = dept_name_to_id[dept_name]
             
             # Map provider to department
             provider_dept_mappings.append((provider_id, dept_id))
@@ -147,7 +138,7 @@ def parse_specialty_rates(rates_text: str) -> Dict[str, int]:
     rates = {}
     
     # Pattern: "- Specialty: $amount"
-    matches = re.findall(r'-\s*([^:]+):\s*\$(\d+)', rates_text)
+    matches = RATE_RE.findall(rates_text)
     
     for specialty, amount in matches:
         specialty = specialty.strip()
@@ -161,7 +152,7 @@ def parse_insurances(insurance_text: str) -> List[str]:
     insurances = []
     
     # Each insurance is on a line starting with "- "
-    matches = re.findall(r'-\s*(.+)', insurance_text)
+    matches = LIST_ITEM_RE.findall(insurance_text)
     
     for insurance in matches:
         insurance = insurance.strip()
@@ -0,0 +1,39 @@
+-- Patient Bundle Migration
+-- Loads a patient with insurance, appointments and referrals in one call, so the
+-- /patient endpoint needs one round trip instead of three.
+-- Requires appointment_view_migration (appointments come from appointments_api_v).
+
+-- Returns the patient row with 'insurances', 'appointments' (newest first) and 'referrals'
+-- nested the way the API's Supabase selects used to embed them; NULL if the patient doesn't exist.
+CREATE OR REPLACE FUNCTION get_patient_bundle(pid INTEGER)
+RETURNS JSONB AS $$
+    SELECT to_jsonb(p) || jsonb_build_object(
+        'insurances', CASE WHEN i.id IS NULL THEN NULL
+                           ELSE jsonb_build_object('id', i.id, 'name', i.name, 'accepted', i.accepted) END,
+        'appointments', COALESCE((
+            SELECT jsonb_agg(jsonb_build_object(
+                'date_str', a.date_str, 'time_str', a.time_str, 'status', a.status, 'notes', a.notes,
+                'providers', jsonb_build_object('first_name', pr.first_name, 'last_name', pr.last_name)
+            ) ORDER BY a.date DESC)
+            FROM appointments_api_v a
+            JOIN providers pr ON pr.id = a.provider_id
+            WHERE a.patient_id = p.id
+        ), '[]'::jsonb),
+        'referrals', COALESCE((
+            SELECT jsonb_agg(jsonb_build_object(
+                'specialties', jsonb_build_object('name', s.name),
+                'providers', CASE WHEN pr.id IS NULL THEN NULL
+                                  ELSE jsonb_build_object('first_name', pr.first_name, 'last_name', pr.last_name) END
+            ))
+            FROM referrals r
+            JOIN specialties s ON s.id = r.specialty_id
+            LEFT JOIN providers pr ON pr.id = r.provider_id
+            WHERE r.patient_id = p.id
+        ), '[]'::jsonb)
+    )
+    FROM patients p
+    LEFT JOIN insurances i ON i.id = p.insurance_id
+    WHERE p.id = pid;
+$$ LANGUAGE sql STABLE;
+
+COMMENT ON FUNCTION get_patient_bundle(INTEGER) IS 'Patient with insurance, appointments and referrals as one JSON document (used by GET /patient/<id>)';
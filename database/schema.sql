@@ -21,7 +21,8 @@ CREATE TABLE providers (
     last_name TEXT NOT NULL,
     certification TEXT NOT NULL,
     specialty_id INTEGER NOT NULL REFERENCES specialties(id),
-    created_at TIMESTAMP DEFAULT NOW()
+    created_at TIMESTAMP DEFAULT NOW(),
+    UNIQUE(first_name, last_name)
 );
 
 COMMENT ON TABLE providers IS 'Healthcare providers (doctors, nurses, etc.)';
@@ -31,7 +32,7 @@ COMMENT ON TABLE providers IS 'Healthcare providers (doctors, nurses, etc.)';
 -- ============================================
 CREATE TABLE departments (
     id SERIAL PRIMARY KEY,
-    name TEXT NOT NULL,
+    name TEXT UNIQUE NOT NULL,
     phone TEXT NOT NULL,
     address TEXT NOT NULL,
     hours TEXT NOT NULL,
@@ -0,0 +1,47 @@
+-- Search Index Migration
+-- Trigram indexes so the agent's ILIKE name searches use an index instead of a sequential scan
+-- Composite indexes matching the agent's availability and appointment-history queries
+-- and the API's patient lookups
+-- Safe to run more than once
+
+-- Step 1: Enable trigram matching (available on Supabase; needs CREATE privilege on the database)
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Step 2: Trigram indexes for ILIKE searches
+-- check_insurance: name ILIKE '%<insurance>%' (leading wildcard can't use a btree index)
+CREATE INDEX IF NOT EXISTS idx_insurances_name_trgm ON insurances USING gin (name gin_trgm_ops);
+
+-- get_providers_by_specialty / get_self_pay_rate: name ILIKE '<specialty>'
+CREATE INDEX IF NOT EXISTS idx_specialties_name_trgm ON specialties USING gin (name gin_trgm_ops);
+
+-- Provider lookups by name (query_database)
+CREATE INDEX IF NOT EXISTS idx_providers_last_name_trgm ON providers USING gin (last_name gin_trgm_ops);
+
+-- Step 3: Composite indexes for the agent's appointment queries
+-- get_available_times: scheduled appointments for a provider at a department in a date range
+CREATE INDEX IF NOT EXISTS idx_appointments_provider_department_date
+ON appointments (provider_id, department_id, date)
+WHERE status = 'scheduled';
+
+-- check_appointment_history: a patient's completed visits with a provider, newest first
+CREATE INDEX IF NOT EXISTS idx_appointments_patient_provider_date
+ON appointments (patient_id, provider_id, date DESC)
+WHERE status = 'completed';
+
+-- Step 4: Indexes for the API's GET /patient/<id> (get_patient_bundle)
+-- A patient's appointments newest first; INCLUDE covers the other columns the bundle reads,
+-- so the appointments can come from an index-only scan
+CREATE INDEX IF NOT EXISTS idx_appointments_patient_date
+ON appointments (patient_id, date DESC)
+INCLUDE (provider_id, appointment_time, status, notes);
+
+-- A patient's referrals (referrals had no index on patient_id)
+CREATE INDEX IF NOT EXISTS idx_referrals_patient ON referrals (patient_id);
+
+-- Verification queries (run these to check the indexes are used)
+-- EXPLAIN SELECT id, name, accepted FROM insurances WHERE name ILIKE '%cross%';
+-- EXPLAIN SELECT date FROM appointments WHERE provider_id = 1 AND department_id = 1
+--     AND date BETWEEN '2026-02-01' AND '2026-02-07' AND status = 'scheduled';
+-- EXPLAIN SELECT date, appointment_time, status, notes, provider_id FROM appointments
+--     WHERE patient_id = 1 ORDER BY date DESC;
+-- (Small tables may still show a Seq Scan: the planner picks it when it's cheaper.)
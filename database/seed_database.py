@@ -2,223 +2,281 @@
 Seed Supabase database with hospital data.
 
 This script:
-1. Connects to Supabase
+1. Connects to the Supabase PostgreSQL database
 2. Parses data_sheet.txt
-3. Populates all tables with data
+3. Populates all tables with data in a single transaction (nothing is left half-seeded on failure)
+
+Safe to re-run: rows are upserted on their natural keys (see database/seed_upsert_migration),
+so existing rows are updated in place instead of duplicated.
 """
 
+import io
 import os
-from datetime import datetime
+import sys
+from operator import itemgetter
 from dotenv import load_dotenv
-from supabase import create_client, Client
+import psycopg2
+from psycopg2.extras import RealDictCursor, execute_values
 from parse_data_sheet import parse_data_sheet
 
 # Load environment variables
 load_dotenv()
 
-SUPABASE_URL = os.getenv('SUPABASE_URL')
-SUPABASE_KEY = os.getenv('SUPABASE_SERVICE_KEY')
+CONNECTION_STRING = os.getenv('POSTGRES_CONNECTION_STRING')
+
+if not CONNECTION_STRING:
+    raise ValueError("Missing POSTGRES_CONNECTION_STRING in .env file")
+
+# Tables with at least COPY_MIN_ROWS rows (and no generated IDs needed back) are loaded with
+# COPY: one stream, no per-statement overhead. Smaller ones use a multi-row INSERT.
+COPY_MIN_ROWS = 50
+
+# Column order of the appointment rows built in seed_appointments
+APT_COLS = ('patient_id', 'provider_id', 'department_id', 'appointment_type', 'date',
+            'appointment_time', 'arrival_time', 'status', 'notes')
+
 
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise ValueError("Missing SUPABASE_URL or SUPABASE_SERVICE_KEY in .env file")
+def copy_value(value) -> str:
+    """A value in COPY's text format (NULL as \\N; backslash, tab and newlines escaped)."""
+    if value is None:
+        return '\\N'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
 
-# Initialize Supabase client
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
+def bulk_copy(cursor, table: str, columns, rows: list):
+    """Load rows (tuples in column order) into table with COPY."""
+    buffer = io.StringIO()
+    write = buffer.write
+    for row in rows:
+        write('\t'.join(map(copy_value, row)) + '\n')
+    buffer.seek(0)
+    cursor.copy_from(buffer, table, columns=columns)
 
-def seed_specialties(parsed_data: dict) -> dict:
+
+def insert_rows(cursor, table: str, rows: list, returning: bool = False, on_conflict: str = None) -> list:
+    """
+    Insert rows (dicts with the same keys) in one statement, or with COPY for large batches.
+    With returning, the generated IDs come back in the same order as rows.
+    With on_conflict (the unique key's columns, e.g. 'name'), rows that already exist are
+    updated in place instead of failing (COPY is skipped: it can't resolve conflicts).
+    Rows must not repeat a key within one call.
+    """
+    if not rows:
+        return []
+    
+    columns = list(rows[0])
+    # itemgetter pulls every column of a row in one C call (a lone column comes back unwrapped)
+    get_values = itemgetter(*columns)
+    values = [get_values(row) for row in rows] if len(columns) > 1 else [(get_values(row),) for row in rows]
+    
+    if not returning and not on_conflict and len(rows) >= COPY_MIN_ROWS:
+        bulk_copy(cursor, table, columns, values)
+        return []
+    
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES %s"
+    if on_conflict:
+        # DO UPDATE (not DO NOTHING) so RETURNING also yields the IDs of rows that already existed
+        sql += f" ON CONFLICT ({on_conflict}) DO UPDATE SET " + ', '.join(f"{column} = EXCLUDED.{column}" for column in columns)
+    if returning:
+        sql += " RETURNING id"
+    inserted = execute_values(cursor, sql, values, page_size=len(values), fetch=returning)
+    return [row['id'] for row in inserted] if returning else []
+
+
+def write_lines(lines: list):
+    """Print a seeding step's progress lines with one write instead of one per row."""
+    if lines:
+        sys.stdout.write('\n'.join(lines) + '\n')
+
+
+def seed_specialties(cursor, parsed_data: dict) -> dict:
     """Insert specialties with rates. Returns {name: id} mapping."""
     print("Seeding specialties...")
     
-    specialty_map = {}
-    
+    rates = parsed_data['specialty_rates']
+    rows = []
     for specialty_name in parsed_data['specialties']:
-        rate = parsed_data['specialty_rates'].get(specialty_name, 0)
+        rate = rates.get(specialty_name, 0)
         
         if rate == 0:
             print(f"  WARNING: No rate found for {specialty_name}, defaulting to 0")
         
-        result = supabase.table('specialties').insert({
-            'name': specialty_name,
-            'self_pay_rate': rate
-        }).execute()
-        
-        specialty_id = result.data[0]['id']
-        specialty_map[specialty_name] = specialty_id
-        print(f"  ✓ {specialty_name} (${rate}) - ID: {specialty_id}")
+        rows.append({'name': specialty_name, 'self_pay_rate': rate})
+    
+    # One multi-row insert, IDs returned in row order
+    ids = insert_rows(cursor, 'specialties', rows, returning=True, on_conflict='name')
+    
+    specialty_map = {}
+    log_lines = []
+    for specialty, specialty_id in zip(rows, ids):
+        specialty_map[specialty['name']] = specialty_id
+        log_lines.append(f"  ✓ {specialty['name']} (${specialty['self_pay_rate']}) - ID: {specialty_id}")
+    write_lines(log_lines)
     
     return specialty_map
 
 
-def seed_providers(parsed_data: dict, specialty_map: dict) -> dict:
+def seed_providers(cursor, parsed_data: dict, specialty_map: dict) -> dict:
     """Insert providers. Returns {index: id} mapping."""
     print("\nSeeding providers...")
     
-    provider_map = {}
-    
-    for idx, provider in enumerate(parsed_data['providers'], start=1):
-        specialty_id = specialty_map.get(provider['specialty'])
-        
-        if not specialty_id:
+    # Report unknown specialties up front; those providers are skipped
+    for provider in parsed_data['providers']:
+        if provider['specialty'] not in specialty_map:
             print(f"  ERROR: Specialty '{provider['specialty']}' not found for {provider['first_name']} {provider['last_name']}")
-            continue
-        
-        result = supabase.table('providers').insert({
+    
+    # (data sheet index, provider) for every provider whose specialty resolved
+    resolved = [
+        (idx, provider) for idx, provider in enumerate(parsed_data['providers'], start=1)
+        if provider['specialty'] in specialty_map
+    ]
+    rows = [
+        {
             'first_name': provider['first_name'],
             'last_name': provider['last_name'],
             'certification': provider['certification'],
-            'specialty_id': specialty_id
-        }).execute()
-        
-        provider_id = result.data[0]['id']
+            'specialty_id': specialty_map[provider['specialty']]
+        }
+        for _, provider in resolved
+    ]
+    
+    # One multi-row insert, IDs returned in row order
+    ids = insert_rows(cursor, 'providers', rows, returning=True, on_conflict='first_name, last_name')
+    
+    provider_map = {}
+    log_lines = []
+    for (idx, provider), provider_id in zip(resolved, ids):
         provider_map[idx] = provider_id
-        print(f"  ✓ Dr. {provider['first_name']} {provider['last_name']} ({provider['specialty']}) - ID: {provider_id}")
+        log_lines.append(f"  ✓ Dr. {provider['first_name']} {provider['last_name']} ({provider['specialty']}) - ID: {provider_id}")
+    write_lines(log_lines)
     
     return provider_map
 
 
-def seed_departments(parsed_data: dict) -> dict:
+def seed_departments(cursor, parsed_data: dict) -> dict:
     """Insert departments. Returns {index: id} mapping."""
     print("\nSeeding departments...")
     
-    dept_map = {}
-    
-    for idx, dept in enumerate(parsed_data['departments'], start=1):
-        result = supabase.table('departments').insert({
+    # One multi-row insert, IDs returned in row order
+    ids = insert_rows(cursor, 'departments', [
+        {
             'name': dept['name'],
             'phone': dept['phone'],
             'address': dept['address'],
             'hours': dept['hours']
-        }).execute()
-        
-        dept_id = result.data[0]['id']
+        }
+        for dept in parsed_data['departments']
+    ], returning=True, on_conflict='name')
+    
+    dept_map = {}
+    log_lines = []
+    for idx, (dept, dept_id) in enumerate(zip(parsed_data['departments'], ids), start=1):
         dept_map[idx] = dept_id
-        print(f"  ✓ {dept['name']} ({dept['hours']}) - ID: {dept_id}")
+        log_lines.append(f"  ✓ {dept['name']} ({dept['hours']}) - ID: {dept_id}")
+    write_lines(log_lines)
     
     return dept_map
 
 
-def seed_provider_departments(parsed_data: dict, provider_map: dict, dept_map: dict):
+def seed_provider_departments(cursor, parsed_data: dict, provider_map: dict, dept_map: dict):
     """Insert provider-department mappings."""
     print("\nSeeding provider-department mappings...")
     
-    for provider_idx, dept_idx in parsed_data['provider_dept_mappings']:
-        provider_id = provider_map.get(provider_idx)
-        dept_id = dept_map.get(dept_idx)
-        
-        if not provider_id or not dept_id:
+    mappings = parsed_data['provider_dept_mappings']
+    
+    # Report mappings to unknown providers/departments up front; those are skipped
+    for provider_idx, dept_idx in mappings:
+        if provider_idx not in provider_map or dept_idx not in dept_map:
             print(f"  ERROR: Invalid mapping - provider {provider_idx}, dept {dept_idx}")
-            continue
-        
-        supabase.table('provider_departments').insert({
-            'provider_id': provider_id,
-            'department_id': dept_id
-        }).execute()
-        
-        print(f"  ✓ Provider {provider_id} ↔ Department {dept_id}")
+    
+    rows = [
+        {'provider_id': provider_map[provider_idx], 'department_id': dept_map[dept_idx]}
+        for provider_idx, dept_idx in mappings
+        if provider_idx in provider_map and dept_idx in dept_map
+    ]
+    
+    # One multi-row insert (or COPY) for all mappings
+    insert_rows(cursor, 'provider_departments', rows, on_conflict='provider_id, department_id')
+    
+    write_lines([f"  ✓ Provider {row['provider_id']} ↔ Department {row['department_id']}" for row in rows])
 
 
-def seed_patients(provider_map: dict):
+def seed_patients(cursor, provider_map: dict):
     """Insert sample patients."""
     print("\nSeeding patients...")
     
-    # Patient 1: John Doe (from requirements)
-    john_result = supabase.table('patients').insert({
-        'first_name': 'John',
-        'last_name': 'Doe',
-        'dob': '01/01/1975',
-        'pcp': 'Dr. Meredith Grey',
-        'ehr_id': '1234abcd',
-        'notes': 'Patient prefers afternoon appointments. Previous no-show on 9/17/24.'
-    }).execute()
-    
-    john_id = john_result.data[0]['id']
-    print(f"  ✓ John Doe - ID: {john_id}")
-    
-    # Patient 2: Jane Smith (optional - for testing multiple patients)
-    jane_result = supabase.table('patients').insert({
-        'first_name': 'Jane',
-        'last_name': 'Smith',
-        'dob': '05/15/1982',
-        'pcp': 'Dr. Chris Perry',
-        'ehr_id': '5678efgh',
-        'notes': 'Patient has morning availability only.'
-    }).execute()
-    
-    jane_id = jane_result.data[0]['id']
-    print(f"  ✓ Jane Smith - ID: {jane_id}")
+    # Both patients in one multi-row insert, IDs returned in row order
+    john_id, jane_id = insert_rows(cursor, 'patients', [
+        # Patient 1: John Doe (from requirements)
+        {
+            'first_name': 'John',
+            'last_name': 'Doe',
+            'dob': '01/01/1975',
+            'pcp': 'Dr. Meredith Grey',
+            'ehr_id': '1234abcd',
+            'notes': 'Patient prefers afternoon appointments. Previous no-show on 9/17/24.'
+        },
+        # Patient 2: Jane Smith (optional - for testing multiple patients)
+        {
+            'first_name': 'Jane',
+            'last_name': 'Smith',
+            'dob': '05/15/1982',
+            'pcp': 'Dr. Chris Perry',
+            'ehr_id': '5678efgh',
+            'notes': 'Patient has morning availability only.'
+        }
+    ], returning=True, on_conflict='ehr_id')
+    
+    write_lines([f"  ✓ John Doe - ID: {john_id}", f"  ✓ Jane Smith - ID: {jane_id}"])
     
     return {'john': john_id, 'jane': jane_id}
 
 
-def seed_appointments(patient_map: dict, provider_map: dict, dept_map: dict):
+def seed_appointments(cursor, patient_map: dict, provider_map: dict, dept_map: dict):
     """Insert appointment history."""
     print("\nSeeding appointments...")
     
     john_id = patient_map['john']
     
-    # John's appointment history (from requirements)
-    appointments = [
-        {
-            'patient_id': john_id,
-            'provider_id': provider_map[1],  # Dr. Grey (provider index 1)
-            'department_id': dept_map[1],    # Sloan Primary Care
-            'appointment_type': 'ESTABLISHED',
-            'date': '2018-03-05',
-            'appointment_time': '09:15',
-            'arrival_time': '09:05',  # ESTABLISHED: 10 min early
-            'status': 'completed',
-            'notes': 'Annual checkup'
-        },
-        {
-            'patient_id': john_id,
-            'provider_id': provider_map[2],  # Dr. House (provider index 2)
-            'department_id': dept_map[2],    # PPTH Orthopedics
-            'appointment_type': 'ESTABLISHED',
-            'date': '2024-08-12',
-            'appointment_time': '14:30',
-            'arrival_time': '14:20',
-            'status': 'completed',
-            'notes': 'Knee pain evaluation'
-        },
-        {
-            'patient_id': john_id,
-            'provider_id': provider_map[1],  # Dr. Grey
-            'department_id': dept_map[1],
-            'appointment_type': 'ESTABLISHED',
-            'date': '2024-09-17',
-            'appointment_time': '10:00',
-            'arrival_time': '09:50',
-            'status': 'noshow',
-            'notes': 'Patient called to reschedule'
-        },
-        {
-            'patient_id': john_id,
-            'provider_id': provider_map[1],  # Dr. Grey
-            'department_id': dept_map[1],
-            'appointment_type': 'ESTABLISHED',
-            'date': '2024-11-25',
-            'appointment_time': '11:30',
-            'arrival_time': '11:20',
-            'status': 'cancelled',
-            'notes': 'Cancelled by patient - conflict'
-        }
+    # John's appointment history (from requirements), as rows in APT_COLS order
+    rows = [
+        # Dr. Grey (provider index 1) at Sloan Primary Care; ESTABLISHED arrives 10 min early
+        (john_id, provider_map[1], dept_map[1], 'ESTABLISHED', '2018-03-05', '09:15', '09:05', 'completed', 'Annual checkup'),
+        # Dr. House (provider index 2) at PPTH Orthopedics
+        (john_id, provider_map[2], dept_map[2], 'ESTABLISHED', '2024-08-12', '14:30', '14:20', 'completed', 'Knee pain evaluation'),
+        (john_id, provider_map[1], dept_map[1], 'ESTABLISHED', '2024-09-17', '10:00', '09:50', 'noshow', 'Patient called to reschedule'),
+        (john_id, provider_map[1], dept_map[1], 'ESTABLISHED', '2024-11-25', '11:30', '11:20', 'cancelled', 'Cancelled by patient - conflict')
     ]
     
-    for apt in appointments:
-        supabase.table('appointments').insert(apt).execute()
-        print(f"  ✓ {apt['date']} - {apt['status']}")
+    # Appointments have no unique key to upsert on, so rows from an earlier run (same
+    # provider, date and time) are skipped instead
+    cursor.execute(
+        "SELECT provider_id, date, appointment_time FROM appointments WHERE patient_id = %s",
+        (john_id,)
+    )
+    existing = {(apt['provider_id'], apt['date'], apt['appointment_time']) for apt in cursor.fetchall()}
+    apt_key = itemgetter(*map(APT_COLS.index, ('provider_id', 'date', 'appointment_time')))
+    new_rows = [row for row in rows if apt_key(row) not in existing]
+    
+    # Straight to COPY: no IDs are needed back, and the history can grow in testing
+    if new_rows:
+        bulk_copy(cursor, 'appointments', APT_COLS, new_rows)
+    
+    date_col, status_col = APT_COLS.index('date'), APT_COLS.index('status')
+    write_lines([f"  ✓ {row[date_col]} - {row[status_col]}" for row in rows])
 
 
-def seed_insurances(parsed_data: dict):
+def seed_insurances(cursor, parsed_data: dict):
     """Insert accepted insurances."""
     print("\nSeeding insurances...")
     
-    for insurance in parsed_data['insurances']:
-        supabase.table('insurances').insert({
-            'name': insurance
-        }).execute()
-        print(f"  ✓ {insurance}")
+    # Each name once, in data sheet order (name is unique)
+    insurances = list(dict.fromkeys(parsed_data['insurances']))
+    
+    # One multi-row upsert for all insurances (re-seeding leaves existing ones in place)
+    insert_rows(cursor, 'insurances', [{'name': insurance} for insurance in insurances], on_conflict='name')
+    
+    write_lines([f"  ✓ {insurance}" for insurance in insurances])
 
 
 def main():
@@ -233,15 +291,19 @@ def main():
     parsed_data = parse_data_sheet('../data_sheet.txt')
     print(f"✓ Found {len(parsed_data['providers'])} providers, {len(parsed_data['departments'])} departments\n")
     
+    conn = psycopg2.connect(CONNECTION_STRING)
+    
     try:
-        # Seed in dependency order
-        specialty_map = seed_specialties(parsed_data)
-        provider_map = seed_providers(parsed_data, specialty_map)
-        dept_map = seed_departments(parsed_data)
-        seed_provider_departments(parsed_data, provider_map, dept_map)
-        patient_map = seed_patients(provider_map)
-        seed_appointments(patient_map, provider_map, dept_map)
-        seed_insurances(parsed_data)
+        # Seed in dependency order, all in one transaction
+        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            specialty_map = seed_specialties(cursor, parsed_data)
+            provider_map = seed_providers(cursor, parsed_data, specialty_map)
+            dept_map = seed_departments(cursor, parsed_data)
+            seed_provider_departments(cursor, parsed_data, provider_map, dept_map)
+            patient_map = seed_patients(cursor, provider_map)
+            seed_appointments(cursor, patient_map, provider_map, dept_map)
+            seed_insurances(cursor, parsed_data)
+        conn.commit()
         
         print("\n" + "="*60)
         print("✓ DATABASE SEEDING COMPLETE!")
@@ -249,13 +311,16 @@ def main():
         print("\nNext step: Run test_db.py to verify data")
         
     except Exception as e:
+        conn.rollback()  # Nothing from this run is kept
         print(f"\n❌ ERROR: {str(e)}")
         print("\nMake sure:")
         print("1. Schema has been applied to Supabase")
         print("2. .env file has correct credentials")
         print("3. data_sheet.txt exists in parent directory")
         raise
-
+    
+    finally:
+        conn.close()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,24 @@
+-- Seed Upsert Migration
+-- Unique keys for the tables seed_database.py upserts into, so re-running the seeder updates
+-- existing rows (INSERT ... ON CONFLICT) instead of duplicating them.
+-- specialties.name, patients.ehr_id, insurances.name and provider_departments already have
+-- unique constraints in schema.sql; new databases created from schema.sql have these too.
+
+-- Step 1: Find existing duplicates (must be resolved before Step 2 can succeed)
+SELECT 'providers' AS table_name, first_name || ' ' || last_name AS key, COUNT(*) AS copies
+FROM providers
+GROUP BY first_name, last_name
+HAVING COUNT(*) > 1
+UNION ALL
+SELECT 'departments', name, COUNT(*)
+FROM departments
+GROUP BY name
+HAVING COUNT(*) > 1;
+
+-- Step 2: One provider per name, one department per name
+CREATE UNIQUE INDEX IF NOT EXISTS idx_providers_unique_name ON providers (first_name, last_name);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_departments_unique_name ON departments (name);
+
+-- Verification query (run this to check the indexes exist)
+-- SELECT indexname, indexdef FROM pg_indexes
+-- WHERE indexname IN ('idx_providers_unique_name', 'idx_departments_unique_name');
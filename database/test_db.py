@@ -2,9 +2,16 @@
 Test database to verify all data was seeded correctly.
 """
 
+import importlib.util
+import io
 import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import cache
+import httpx
 from dotenv import load_dotenv
-from supabase import create_client, Client
+from supabase import create_client, Client, ClientOptions
 
 # Load environment variables
 load_dotenv()
@@ -15,14 +22,27 @@ SUPABASE_KEY = os.getenv('SUPABASE_SERVICE_KEY')
 if not SUPABASE_URL or not SUPABASE_KEY:
     raise ValueError("Missing SUPABASE_URL or SUPABASE_SERVICE_KEY in .env file")
 
-# Initialize Supabase client
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+
+@cache
+def get_client() -> Client:
+    """
+    Shared Supabase client (created on first use).
+    All tests query through one keep-alive httpx client, multiplexed over HTTP/2 when h2 is installed,
+    instead of setting up a connection per query.
+    """
+    return create_client(SUPABASE_URL, SUPABASE_KEY, options=ClientOptions(
+        httpx_client=httpx.Client(
+            http2=importlib.util.find_spec("h2") is not None,
+            timeout=30,
+            follow_redirects=True
+        )
+    ))
 
 
 def test_specialties():
     """Test specialties table."""
     print("\n=== TESTING SPECIALTIES ===")
-    result = supabase.table('specialties').select('*').execute()
+    result = get_client().table('specialties').select('name, self_pay_rate').execute()
     
     print(f"Count: {len(result.data)}")
     for spec in result.data:
@@ -35,7 +55,7 @@ def test_specialties():
 def test_providers():
     """Test providers table with JOIN to specialties."""
     print("\n=== TESTING PROVIDERS ===")
-    result = supabase.table('providers').select('*, specialties(name)').execute()
+    result = get_client().table('providers').select('first_name, last_name, certification, specialties(name)').execute()
     
     print(f"Count: {len(result.data)}")
     for provider in result.data:
@@ -49,7 +69,7 @@ def test_providers():
 def test_departments():
     """Test departments table."""
     print("\n=== TESTING DEPARTMENTS ===")
-    result = supabase.table('departments').select('*').execute()
+    result = get_client().table('departments').select('name, hours, address, phone').execute()
     
     print(f"Count: {len(result.data)}")
     for dept in result.data:
@@ -65,8 +85,7 @@ def test_provider_departments():
     print("\n=== TESTING PROVIDER-DEPARTMENT MAPPINGS ===")
     
     # Get mappings with provider and department names
-    result = supabase.table('provider_departments').select('''
-        *,
+    result = get_client().table('provider_departments').select('''
         providers(first_name, last_name),
         departments(name)
     ''').execute()
@@ -89,7 +108,7 @@ def test_provider_departments():
 def test_patients():
     """Test patients table."""
     print("\n=== TESTING PATIENTS ===")
-    result = supabase.table('patients').select('*').execute()
+    result = get_client().table('patients').select('first_name, last_name, dob, pcp, ehr_id, notes').execute()
     
     print(f"Count: {len(result.data)}")
     for patient in result.data:
@@ -108,8 +127,8 @@ def test_appointments():
     print("\n=== TESTING APPOINTMENTS ===")
     
     # Get appointments with patient and provider names
-    result = supabase.table('appointments').select('''
-        *,
+    result = get_client().table('appointments').select('''
+        date, appointment_time, appointment_type, status, arrival_time, notes,
         patients(first_name, last_name),
         providers(first_name, last_name),
         departments(name)
@@ -124,14 +143,16 @@ def test_appointments():
         patient_name = f"{patient['first_name']} {patient['last_name']}"
         provider_name = f"Dr. {provider['first_name']} {provider['last_name']}"
         
-        print(f"\n  {apt['date']} at {apt['appointment_time']} ({apt['appointment_type']})")
-        print(f"    Patient: {patient_name}")
-        print(f"    Provider: {provider_name}")
-        print(f"    Location: {dept['name']}")
-        print(f"    Status: {apt['status']}")
-        print(f"    Arrival time: {apt['arrival_time']}")
-        if apt.get('notes'):
-            print(f"    Notes: {apt['notes']}")
+        # One write per appointment
+        sys.stdout.write(
+            f"\n  {apt['date']} at {apt['appointment_time']} ({apt['appointment_type']})\n"
+            f"    Patient: {patient_name}\n"
+            f"    Provider: {provider_name}\n"
+            f"    Location: {dept['name']}\n"
+            f"    Status: {apt['status']}\n"
+            f"    Arrival time: {apt['arrival_time']}\n"
+            + (f"    Notes: {apt['notes']}\n" if apt.get('notes') else "")
+        )
     
     assert len(result.data) >= 4, "Expected at least 4 appointments for John Doe"
     print("✓ Appointments test passed")
@@ -140,7 +161,7 @@ def test_appointments():
 def test_insurances():
     """Test insurances table."""
     print("\n=== TESTING INSURANCES ===")
-    result = supabase.table('insurances').select('*').execute()
+    result = get_client().table('insurances').select('name').execute()
     
     print(f"Count: {len(result.data)}")
     for ins in result.data:
@@ -155,22 +176,19 @@ def test_complex_query():
     print("\n=== TESTING COMPLEX QUERY ===")
     print("Query: Find all orthopedic providers and their locations")
     
-    # First get specialty ID
-    specialty_result = supabase.table('specialties').select('id').eq('name', 'Orthopedics').execute()
-    
-    if not specialty_result.data:
-        print("  No Orthopedics specialty found")
-        return
-    
-    specialty_id = specialty_result.data[0]['id']
-    
-    # Get providers with this specialty
-    providers_result = supabase.table('providers').select('''
-        *,
+    # Providers filtered by specialty name in one request (the !inner embed drops
+    # providers whose specialty doesn't match)
+    providers_result = get_client().table('providers').select('''
+        first_name, last_name,
+        specialties!inner(name),
         provider_departments(
             departments(name, address, hours)
         )
-    ''').eq('specialty_id', specialty_id).execute()
+    ''').eq('specialties.name', 'Orthopedics').execute()
+    
+    if not providers_result.data:
+        print("  No Orthopedics providers found")
+        return
     
     print(f"Found {len(providers_result.data)} orthopedic providers:")
     for provider in providers_result.data:
@@ -188,37 +206,15 @@ def test_new_vs_established():
     """Test determining NEW vs ESTABLISHED appointment."""
     print("\n=== TESTING NEW vs ESTABLISHED LOGIC ===")
     
-    # Get John Doe
-    patient_result = supabase.table('patients').select('id').eq('first_name', 'John').eq('last_name', 'Doe').execute()
-    
-    if not patient_result.data:
-        print("  John Doe not found")
-        return
-    
-    john_id = patient_result.data[0]['id']
-    
-    # Get Dr. House
-    house_result = supabase.table('providers').select('id').eq('last_name', 'House').execute()
-    
-    if not house_result.data:
-        print("  Dr. House not found")
-        return
-    
-    house_id = house_result.data[0]['id']
-    
-    # Check if John has seen House in last 5 years
-    # For testing, we'll just check if any completed appointments exist
-    history_result = supabase.table('appointments').select('*').eq(
-        'patient_id', john_id
-    ).eq(
-        'provider_id', house_id
-    ).eq(
-        'status', 'completed'
-    ).execute()
+    # Has John Doe seen Dr. House? (completed visits, joined server-side in one call;
+    # needs database/check_established_migration)
+    history = get_client().rpc('check_established', {
+        'p_first': 'John', 'p_last': 'Doe', 'd_last': 'House'
+    }).execute().data[0]
     
-    if history_result.data:
-        print(f"  John Doe HAS seen Dr. House before ({len(history_result.data)} time(s))")
-        print(f"  Most recent: {history_result.data[0]['date']}")
+    if history['has_history']:
+        print(f"  John Doe HAS seen Dr. House before ({history['count']} time(s))")
+        print(f"  Most recent: {history['last_date']}")
         print(f"  → Next appointment should be: ESTABLISHED")
     else:
         print(f"  John Doe has NOT seen Dr. House before")
@@ -227,6 +223,66 @@ def test_new_vs_established():
     print("✓ NEW vs ESTABLISHED test passed")
 
 
+TESTS = [
+    test_specialties,
+    test_providers,
+    test_departments,
+    test_provider_departments,
+    test_patients,
+    test_appointments,
+    test_insurances,
+    test_complex_query,
+    test_new_vs_established
+]
+
+# The tests are independent reads, so they run concurrently; each one's output is captured
+# in its own buffer and printed in order afterwards
+_output = threading.local()
+
+
+class ThreadStdout:
+    """sys.stdout stand-in that sends a test thread's prints to that thread's buffer."""
+    
+    def __init__(self, stdout):
+        self.stdout = stdout
+    
+    def write(self, text):
+        return getattr(_output, 'buffer', self.stdout).write(text)
+    
+    def flush(self):
+        getattr(_output, 'buffer', self.stdout).flush()
+
+
+def run_captured(test):
+    """Run a test with its output captured. Returns (output, exception or None)."""
+    _output.buffer = io.StringIO()
+    try:
+        test()
+        return _output.buffer.getvalue(), None
+    except Exception as e:
+        return _output.buffer.getvalue(), e
+    finally:
+        del _output.buffer
+
+
+def run_tests():
+    """Run TESTS concurrently, print their output in order, and raise the first failure."""
+    get_client()  # Created once up front rather than raced by the test threads
+    
+    stdout = sys.stdout
+    sys.stdout = ThreadStdout(stdout)
+    try:
+        with ThreadPoolExecutor(max_workers=len(TESTS)) as executor:
+            results = list(executor.map(run_captured, TESTS))
+    finally:
+        sys.stdout = stdout
+    
+    for output, error in results:
+        print(output, end='')
+        if error:
+            raise error
+
+
 def main():
     """Run all tests."""
     print("="*60)
@@ -234,15 +290,7 @@ def main():
     print("="*60)
     
     try:
-        test_specialties()
-        test_providers()
-        test_departments()
-        test_provider_departments()
-        test_patients()
-        test_appointments()
-        test_insurances()
-        test_complex_query()
-        test_new_vs_established()
+        run_tests()
         
         print("\n" + "="*60)
         print("✓ ALL TESTS PASSED!")
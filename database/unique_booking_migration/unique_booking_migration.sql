@@ -0,0 +1,18 @@
+-- Unique Booking Migration
+-- A provider can't have two scheduled appointments at the same department, date and time.
+-- /api/book relies on this to reject double bookings (HTTP 409) instead of checking first.
+
+-- Step 1: Find existing double bookings (must be resolved before Step 2 can succeed)
+SELECT provider_id, department_id, date, appointment_time, COUNT(*) AS bookings
+FROM appointments
+WHERE status = 'scheduled'
+GROUP BY provider_id, department_id, date, appointment_time
+HAVING COUNT(*) > 1;
+
+-- Step 2: Enforce one scheduled appointment per slot (cancelled/completed rows don't count)
+CREATE UNIQUE INDEX IF NOT EXISTS idx_appointments_unique_scheduled_slot
+ON appointments (provider_id, department_id, date, appointment_time)
+WHERE status = 'scheduled';
+
+-- Verification query (run this to check the index exists)
+-- SELECT indexname, indexdef FROM pg_indexes WHERE indexname = 'idx_appointments_unique_scheduled_slot';